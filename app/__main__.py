@@ -0,0 +1,15 @@
+# app/__main__.py
+"""
+Точка входа бота: python -m app
+
+Отдельный модуль, а не python -m app.main: процессы догоняющего режима
+(forkserver/spawn) заново импортируют __main__ родителя, и с app.main каждый
+из них создавал бы Bot, второе подключение к sqlite и т.д. Модули вида
+<пакет>.__main__ multiprocessing в дочерних не импортирует.
+"""
+if __name__ == "__main__":
+    import asyncio
+
+    from app.main import main
+
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+# app/audio.py
+"""
+Кодирование/декодирование аудио внутри процесса (PyAV = libav* из ffmpeg),
+без запуска отдельного ffmpeg на каждое сообщение:
+  - Telegram OGG/Opus → PCM s16le mono 16 кГц для Vosk;
+  - MP3 (или сырой PCM) → OGG/Opus для voice-ответа.
+Если PyAV нет или он не справился — вызывающий код откатывается на ffmpeg.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import BinaryIO, Iterator, Union
+
+PathLike = Union[str, Path]
+Output = Union[str, Path, BinaryIO]  # путь или файловый объект (например, BytesIO)
+
+VOICE_RATE = 48000       # Telegram voice: Opus 48 кГц mono
+VOICE_BITRATE = 64000
+
+
+def _pcm_bytes(frame) -> bytes:
+    # packed s16 mono: в плоскости могут быть байты выравнивания — отрезаем
+    return bytes(frame.planes[0])[: frame.samples * 2]
+
+
+def decode_to_pcm(path: PathLike, rate: int = 16000) -> bytes:
+    """Любой аудиофайл → PCM s16le mono с частотой rate."""
+    import av  # pip install av
+
+    resampler = av.AudioResampler(format="s16", layout="mono", rate=rate)
+    chunks = []
+    with av.open(str(path)) as container:
+        for frame in container.decode(audio=0):
+            for out in resampler.resample(frame):
+                chunks.append(_pcm_bytes(out))
+    for out in resampler.resample(None):
+        chunks.append(_pcm_bytes(out))
+    return b"".join(chunks)
+
+
+def _encode_frames(frames: Iterator, dst: Output) -> None:
+    import av
+
+    with av.open(dst if hasattr(dst, "write") else str(dst), "w", format="ogg") as out:
+        stream = out.add_stream("libopus", rate=VOICE_RATE)
+        stream.layout = "mono"
+        stream.bit_rate = VOICE_BITRATE
+        # кодек сам приводит формат/частоту и режет на кадры нужного размера
+        for frame in frames:
+            frame.pts = None
+            for packet in stream.encode(frame):
+                out.mux(packet)
+        for packet in stream.encode(None):
+            out.mux(packet)
+
+
+def encode_ogg_opus(src: PathLike, dst: PathLike) -> None:
+    """MP3 (или любой аудиофайл) → OGG/Opus mono 48 кГц, как голосовое Telegram."""
+    import av
+
+    with av.open(str(src)) as container:
+        _encode_frames(container.decode(audio=0), dst)
+
+
+def encode_pcm_ogg_opus(pcm: bytes, rate: int, dst: Output) -> None:
+    """Сырой PCM s16le mono → OGG/Opus (в файл или в BytesIO)."""
+    import av
+
+    samples = len(pcm) // 2
+    frame = av.AudioFrame(format="s16", layout="mono", samples=samples)
+    frame.planes[0].update(pcm[: samples * 2])
+    frame.sample_rate = rate
+    _encode_frames(iter([frame]), dst)
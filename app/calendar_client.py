@@ -1,12 +1,19 @@
 # app/calendar_client.py
 
 import os
+import asyncio
+import heapq
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime, timedelta, timezone
-from typing import List, Dict, Optional   # 👈 добавили
+from typing import AsyncIterator, List, Dict, Optional, Tuple   # 👈 добавили
+from zoneinfo import ZoneInfo
 
+from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 
 
 def _ensure_rfc3339(dt: datetime) -> str:
@@ -28,13 +35,96 @@ def _ensure_rfc3339(dt: datetime) -> str:
     return dt.isoformat()
 
 
+def _start_dt(ev: Dict) -> datetime:
+    """Начало события (aware). Целодневные — полночь в TZ из окружения."""
+    s = ev["start"]
+    if "dateTime" in s:
+        return datetime.fromisoformat(s["dateTime"].replace("Z", "+00:00"))
+    return datetime.fromisoformat(s["date"]).replace(tzinfo=ZoneInfo(os.getenv("TZ", "UTC")))
+
+
+# окончания для грубого сравнения слов: «планёрки», «планёрку» → «планерк»
+_ENDINGS = sorted(
+    ["ами", "ями", "ого", "его", "ому", "ему", "ов", "ев", "ей", "ам", "ям", "ах", "ях", "ой",
+     "ом", "ем", "ую", "юю", "ая", "яя", "ое", "ее", "ые", "ие", "ый", "ий",
+     "у", "ю", "а", "я", "ы", "и", "е", "о", "ь"],
+    key=len,
+    reverse=True,
+)
+
+
+def _stem(word: str) -> str:
+    word = word.lower().replace("ё", "е")
+    for ending in _ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            return word[: -len(ending)]
+    return word
+
+
+def _matches(selector: str, summary: str) -> bool:
+    """Все значимые слова selector (по основам) есть в названии — падеж и число не важны."""
+    words = [_stem(w) for w in selector.split() if len(w) >= 3]
+    if not words:
+        return False
+    summary = summary.lower().replace("ё", "е")
+    return all(w in summary for w in words)
+
+
+def _event_item(ev: Dict, calendar_id: Optional[str] = None) -> Dict:
+    """
+    Приводит сырое событие Google к единому виду:
+    {id, summary, start, end, human, calendar_id, series_id} — так его отдают list/create/move/delete.
+    series_id — id серии, если это вхождение повторяющегося события (recurringEventId).
+    """
+    # start может быть dateTime (обычное событие) или date (целодневное)
+    start_dt = ev.get("start", {})
+    end_dt = ev.get("end", {})
+    summary = ev.get("summary", "(без названия)")
+
+    if "dateTime" in start_dt:
+        when = start_dt["dateTime"]
+        # человекочитаемо
+        try:
+            dt = datetime.fromisoformat(when.replace("Z", "+00:00"))
+            human = f"{dt.strftime('%d.%m.%Y %H:%M')}: {summary}"
+        except Exception:
+            human = f"{when}: {summary}"
+    else:
+        # целодневное
+        date_str = start_dt.get("date")
+        human = f"{date_str}: {summary}" if date_str else summary
+
+    return {
+        "id": ev["id"],
+        "summary": summary,
+        "start": start_dt,
+        "end": end_dt,
+        "human": human,
+        "calendar_id": calendar_id,
+        "series_id": ev.get("recurringEventId"),
+    }
+
+
 class CalendarClient:
-    def __init__(self, calendar_id: str | None = None):
+    def __init__(
+        self,
+        calendar_id: str | None = None,
+        calendar_ids: List[str] | None = None,
+        token_path: str | Path | None = None,
+    ):
         """
         Обёртка над Google Calendar API.
-        calendar_id = 'primary' (по умолчанию) или ID конкретного календаря.
+        calendar_id = 'primary' (по умолчанию) или ID конкретного календаря — туда создаём события.
+        calendar_ids — все календари, по которым смотрим/переносим/удаляем
+        (по умолчанию CALENDAR_IDS через запятую, иначе только calendar_id).
+        token_path — токен конкретного пользователя (многопользовательский режим);
+        по умолчанию GOOGLE_TOKEN_PATH или state/google_token.json.
         """
         self.calendar_id = calendar_id or os.getenv("CALENDAR_ID", "primary")
+        ids = calendar_ids or [c.strip() for c in os.getenv("CALENDAR_IDS", "").split(",") if c.strip()]
+        self.calendar_ids = ids or [self.calendar_id]
+        if self.calendar_id not in self.calendar_ids:
+            self.calendar_ids.insert(0, self.calendar_id)
 
         # Абсолютный путь к корню проекта
         ROOT_DIR = Path(__file__).resolve().parents[1]
@@ -43,7 +133,8 @@ class CalendarClient:
         default_token = ROOT_DIR / "state" / "google_token.json"
 
         # Можно переопределить через переменную окружения GOOGLE_TOKEN_PATH
-        token_path = Path(os.getenv("GOOGLE_TOKEN_PATH", default_token)).resolve()
+        token_path = Path(token_path or os.getenv("GOOGLE_TOKEN_PATH", default_token)).resolve()
+        self.token_path = token_path
 
         if not token_path.exists():
             raise RuntimeError(
@@ -56,10 +147,46 @@ class CalendarClient:
             ["https://www.googleapis.com/auth/calendar"]
         )
         self.service = build("calendar", "v3", credentials=self.creds)
+        # httplib2 внутри service не потокобезопасен — у каждого потока свой экземпляр
+        self._local = threading.local()
+        self._local.service = self.service
+        # постоянный пул: потоки (и их service) живут между вызовами
+        self._pool = ThreadPoolExecutor(max_workers=len(self.calendar_ids), thread_name_prefix="calendar")
+
+    def _svc(self):
+        svc = getattr(self._local, "service", None)
+        if svc is None:
+            svc = self._local.service = build("calendar", "v3", credentials=self.creds)
+        return svc
+
+    def refresh_credentials(self, margin: timedelta = timedelta(minutes=10)) -> bool:
+        """
+        Обновить access token заранее, если он истекает в ближайшие margin
+        (в фоне — чтобы не платить за refresh на запросе пользователя).
+        Обновлённый токен пишем обратно в файл. True — если обновляли.
+        """
+        expiry = self.creds.expiry  # naive UTC
+        if expiry is not None and expiry - margin > datetime.utcnow():
+            return False
+        if not self.creds.refresh_token:
+            return False
+        self.creds.refresh(Request())
+        tmp = self.token_path.with_suffix(".tmp")
+        tmp.write_text(self.creds.to_json())
+        tmp.replace(self.token_path)
+        return True
+
+    def close(self) -> None:
+        """Отпустить потоки пула (клиент вытеснен из кэша)."""
+        self._pool.shutdown(wait=False)
 
     # ---- CREATE ----
     # app/calendar_client.py — замените метод create_event целиком
-    def create_event(self, title, start, end, reminder_minutes=30):
+    def create_event(self, title, start, end, reminder_minutes=30, recurrence: Optional[str] = None):
+        """
+        recurrence — строка RRULE (например "RRULE:FREQ=WEEKLY;BYDAY=MO"),
+        тогда start/end задают первое вхождение серии.
+        """
         tz_name = os.getenv("TZ", "UTC")
 
         def _dt_payload(dt: datetime) -> Dict[str, str]:
@@ -94,70 +221,123 @@ class CalendarClient:
         else:
             raise ValueError("Не задано корректное время начала события")
 
-        event = self.service.events().insert(calendarId=self.calendar_id, body=body).execute()
+        if recurrence:
+            # для повторяющихся событий Google требует явный timeZone у start/end
+            body["recurrence"] = [recurrence]
+            for key in ("start", "end"):
+                if "dateTime" in body[key]:
+                    body[key]["timeZone"] = tz_name
+
+        event = self._svc().events().insert(calendarId=self.calendar_id, body=body).execute()
         return {
             "id": event["id"],
             "summary": event.get("summary", title),
             "when_human": start.strftime("%d.%m.%Y %H:%M") if start else "(дата)",
+            "item": _event_item(event, self.calendar_id),
         }
 
 
     # ---- LIST ----
-    def list_events(self, start: datetime, end: datetime) -> List[Dict]:
-        """
-        Возвращает список событий в диапазоне [start, end) с красивым полем 'human'.
-        Поддержка пагинации.
-        """
+    def _fetch_page(
+        self, calendar_id: str, start: datetime, end: datetime, page_token: Optional[str]
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """Одна страница событий календаря (уже отсортирована по началу)."""
+        response = self._svc().events().list(
+            calendarId=calendar_id,
+            timeMin=_ensure_rfc3339(start),
+            timeMax=_ensure_rfc3339(end),
+            singleEvents=True,
+            orderBy="startTime",
+            maxResults=2500,
+            pageToken=page_token
+        ).execute()
+        items = [_event_item(ev, calendar_id) for ev in response.get("items", [])]
+        return items, response.get("nextPageToken")
+
+    def _list_calendar(self, calendar_id: str, start: datetime, end: datetime) -> List[Dict]:
         items: List[Dict] = []
         page_token = None
         while True:
-            response = self.service.events().list(
-                calendarId=self.calendar_id,
-                timeMin=_ensure_rfc3339(start),
-                timeMax=_ensure_rfc3339(end),
-                singleEvents=True,
-                orderBy="startTime",
-                maxResults=2500,
-                pageToken=page_token
-            ).execute()
-
-            for ev in response.get("items", []):
-                # start может быть dateTime (обычное событие) или date (целодневное)
-                start_dt = ev.get("start", {})
-                end_dt = ev.get("end", {})
-                summary = ev.get("summary", "(без названия)")
-
-                if "dateTime" in start_dt:
-                    when = start_dt["dateTime"]
-                    # человекочитаемо
-                    try:
-                        dt = datetime.fromisoformat(when.replace("Z", "+00:00"))
-                        human = f"{dt.strftime('%d.%m.%Y %H:%M')}: {summary}"
-                    except Exception:
-                        human = f"{when}: {summary}"
-                else:
-                    # целодневное
-                    date_str = start_dt.get("date")
-                    human = f"{date_str}: {summary}" if date_str else summary
-
-                items.append({
-                    "id": ev["id"],
-                    "summary": summary,
-                    "start": start_dt,
-                    "end": end_dt,
-                    "human": human,
-                })
-
-            page_token = response.get("nextPageToken")
+            page, page_token = self._fetch_page(calendar_id, start, end, page_token)
+            items += page
             if not page_token:
                 break
-
         return items
 
+    def list_events(self, start: datetime, end: datetime) -> List[Dict]:
+        """
+        Возвращает список событий в диапазоне [start, end) с красивым полем 'human'.
+        Поддержка пагинации. Календари опрашиваются параллельно, уже отсортированные
+        списки сливаются k-way слиянием (без общей пересортировки).
+        """
+        if len(self.calendar_ids) == 1:
+            return self._list_calendar(self.calendar_ids[0], start, end)
+        per_calendar = list(self._pool.map(lambda cid: self._list_calendar(cid, start, end), self.calendar_ids))
+        return list(heapq.merge(*per_calendar, key=_start_dt))
+
+    async def stream_events(self, start: datetime, end: datetime) -> AsyncIterator[Dict]:
+        """
+        То же, что list_events, но потоково: события отдаются по мере готовности
+        всех «голов» — медленный календарь не задерживает начало выдачи
+        дольше своей первой страницы.
+        """
+        queues = [asyncio.Queue(maxsize=4) for _ in self.calendar_ids]
+
+        async def _produce(cid: str, q: asyncio.Queue) -> None:
+            page_token = None
+            try:
+                while True:
+                    page, page_token = await asyncio.to_thread(self._fetch_page, cid, start, end, page_token)
+                    await q.put(page)
+                    if not page_token:
+                        break
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                await q.put(None)  # потребитель увидит конец потока, а ошибку — ниже
+                raise
+            await q.put(None)
+
+        producers = [asyncio.create_task(_produce(cid, q)) for cid, q in zip(self.calendar_ids, queues)]
+
+        async def _items(q: asyncio.Queue) -> AsyncIterator[Dict]:
+            while True:
+                page = await q.get()
+                if page is None:
+                    return
+                for item in page:
+                    yield item
+
+        streams = [_items(q) for q in queues]
+        try:
+            # куча «голов»: (начало, номер календаря, порядковый номер, событие)
+            heap = []
+            seq = 0
+            for idx, stream in enumerate(streams):
+                item = await anext(stream, None)
+                if item is not None:
+                    heap.append((_start_dt(item), idx, seq, item))
+                    seq += 1
+            heapq.heapify(heap)
+            while heap:
+                _key, idx, _seq, item = heapq.heappop(heap)
+                yield item
+                nxt = await anext(streams[idx], None)
+                if nxt is not None:
+                    heapq.heappush(heap, (_start_dt(nxt), idx, seq, nxt))
+                    seq += 1
+            # ошибки календарей не глотаем
+            for task in producers:
+                if task.done() and task.exception():
+                    raise task.exception()
+        finally:
+            for task in producers:
+                task.cancel()
+
     # ---- MOVE ----
-    def move_event(self, selector: str, new_start: datetime, new_end: Optional[datetime]) -> Dict[str, str]:
+    def move_event(self, selector: str, new_start: datetime, new_end: Optional[datetime]) -> Dict:
         """
-        Перенос события по подстроке selector (без регистра).
+        Перенос события по словам selector (см. _matches) — во всех календарях.
         Берём ближайшее будущее событие, иначе самое свежее прошлое.
         """
         now = datetime.now(timezone.utc)
@@ -166,20 +346,12 @@ class CalendarClient:
             now + timedelta(days=365),
         )
 
-        sel = selector.lower()
-        matches = [e for e in events if sel in e["summary"].lower()]
+        matches = [e for e in events if _matches(selector, e["summary"])]
 
         if not matches:
             return {"human": "Событие не найдено"}
 
         # сортируем: сначала будущие по времени начала, потом прошлые (по убыванию)
-        def _start_dt(ev: Dict) -> datetime:
-            s = ev["start"]
-            if "dateTime" in s:
-                return datetime.fromisoformat(s["dateTime"].replace("Z", "+00:00"))
-            # для целодневных берём начало дня в UTC
-            return datetime.fromisoformat(s["date"] + "T00:00:00+00:00")
-
         future = [e for e in matches if _start_dt(e) >= now]
         if future:
             target = sorted(future, key=_start_dt)[0]
@@ -193,16 +365,23 @@ class CalendarClient:
             "start": {"dateTime": _ensure_rfc3339(new_start)},
             "end": {"dateTime": _ensure_rfc3339(new_end)},
         }
-        updated = self.service.events().patch(
-            calendarId=self.calendar_id, eventId=target["id"], body=body
+        calendar_id = target.get("calendar_id") or self.calendar_id
+        updated = self._svc().events().patch(
+            calendarId=calendar_id, eventId=target["id"], body=body
         ).execute()
-        return {"human": f"Перенёс «{updated.get('summary', '')}» на {new_start.strftime('%d.%m.%Y %H:%M')}"}
+        return {
+            "human": f"Перенёс «{updated.get('summary', '')}» на {new_start.strftime('%d.%m.%Y %H:%M')}",
+            "id": target["id"],
+            "old": target,
+            "item": _event_item(updated, calendar_id),
+        }
 
     # ---- DELETE ----
-    def delete_event(self, selector: str) -> Dict[str, str]:
+    def delete_event(self, selector: str, whole_series: bool = False) -> Dict:
         """
-        Удаляет событие по подстроке selector (без регистра).
-        Логика выбора — как в move_event.
+        Удаляет событие по словам selector (см. _matches).
+        Логика выбора — как в move_event. Для вхождения серии удаляется только оно,
+        при whole_series=True — вся серия (тогда в ответе series_deleted=True).
         """
         now = datetime.now(timezone.utc)
         events = self.list_events(
@@ -210,24 +389,65 @@ class CalendarClient:
             now + timedelta(days=365),
         )
 
-        sel = selector.lower()
-        matches = [e for e in events if sel in e["summary"].lower()]
+        matches = [e for e in events if _matches(selector, e["summary"])]
 
         if not matches:
             return {"human": "Событие не найдено"}
 
-        def _start_dt(ev: Dict) -> datetime:
-            s = ev["start"]
-            if "dateTime" in s:
-                return datetime.fromisoformat(s["dateTime"].replace("Z", "+00:00"))
-            return datetime.fromisoformat(s["date"] + "T00:00:00+00:00")
-
         future = [e for e in matches if _start_dt(e) >= now]
         if future:
             target = sorted(future, key=_start_dt)[0]
         else:
             target = sorted(matches, key=_start_dt, reverse=True)[0]
 
-        self.service.events().delete(calendarId=self.calendar_id, eventId=target["id"]).execute()
-        return {"human": f"Удалил событие: {target['summary']}"}
+        calendar_id = target.get("calendar_id") or self.calendar_id
+        series_id = target.get("series_id")
+        if whole_series and series_id:
+            self._svc().events().delete(calendarId=calendar_id, eventId=series_id).execute()
+            return {
+                "human": f"Удалил все повторения: {target['summary']}",
+                "id": series_id,
+                "item": target,
+                "series_deleted": True,
+            }
+        self._svc().events().delete(calendarId=calendar_id, eventId=target["id"]).execute()
+        return {
+            "human": f"Удалил событие: {target['summary']}",
+            "id": target["id"],
+            "item": target,
+            "series_deleted": False,
+        }
+
+    # ---- SERIES ----
+    def occurrence_status(self, series_id: str, occ: datetime, calendar_id: Optional[str] = None) -> str:
+        """
+        Состояние вхождения серии, начинающегося (по правилу) в occ:
+          "ok"      — на месте;
+          "skipped" — это вхождение удалено или перенесено;
+          "gone"    — серии больше нет (удалена, в том числе в самом Google).
+        """
+        calendar_id = calendar_id or self.calendar_id
+        try:
+            series = self._svc().events().get(calendarId=calendar_id, eventId=series_id).execute()
+        except HttpError as e:
+            if e.resp.status in (404, 410):
+                return "gone"
+            raise
+        if series.get("status") == "cancelled":
+            return "gone"
+
+        # ищем по исходному времени: перенесённое вхождение тоже найдётся
+        response = self._svc().events().instances(
+            calendarId=calendar_id,
+            eventId=series_id,
+            originalStart=_ensure_rfc3339(occ),
+            showDeleted=True,
+        ).execute()
+        for ev in response.get("items", []):
+            if ev.get("status") == "cancelled":
+                return "skipped"
+            return "ok" if _start_dt(ev) == occ else "skipped"
+        # Google такого вхождения не знает (расхождение в разворачивании правила) —
+        # лучше напомнить, чем молча пропустить
+        return "ok"
 
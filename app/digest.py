@@ -0,0 +1,178 @@
+# app/digest.py
+"""
+Предрассчитанная сводка на день: текст повестки + готовый голосовой OGG.
+
+Артефакт строится заранее (по расписанию) и отдаётся на «что у меня сегодня»
+без похода в календарь и без TTS. Изменения, сделанные через бота
+(create/move/delete), применяются к артефакту инкрементально: список событий
+правится на месте, текст перерисовывается сразу, голос пересинтезируется в фоне.
+"""
+from __future__ import annotations
+
+import asyncio
+import bisect
+import logging
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, tzinfo
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+EMPTY_TEXT = "Ничего не запланировано."
+
+
+def _item_start(item: Dict, tz: tzinfo) -> datetime:
+    s = item.get("start", {})
+    if "dateTime" in s:
+        return datetime.fromisoformat(s["dateTime"].replace("Z", "+00:00")).astimezone(tz)
+    # целодневное — начало дня
+    return datetime.combine(date.fromisoformat(s["date"]), datetime.min.time(), tz)
+
+
+def render_agenda(events: List[Dict]) -> str:
+    if not events:
+        return EMPTY_TEXT
+    return "\n".join(e["human"] for e in events)
+
+
+@dataclass
+class DayDigest:
+    day: date
+    events: List[Dict]
+    text: str
+    built_at: datetime
+    voice_path: Optional[Path] = None
+    voice_task: Optional[asyncio.Task] = field(default=None, repr=False)
+
+    async def voice(self) -> Optional[Path]:
+        """Готовый OGG; если синтез ещё идёт — дождаться его."""
+        if self.voice_task is not None and not self.voice_task.done():
+            try:
+                await asyncio.shield(self.voice_task)
+            except Exception:
+                pass
+        return self.voice_path
+
+
+class AgendaDigest:
+    def __init__(
+        self,
+        list_events: Callable[[datetime, datetime], List[Dict]],
+        synthesize: Callable[[str], Awaitable[Path]],
+        tz: tzinfo,
+        voice: bool = True,
+    ):
+        self._list_events = list_events
+        self._synthesize = synthesize
+        self._tz = tz
+        self._voice = voice
+        self._days: Dict[date, DayDigest] = {}
+        # фоновые пересборки из invalidate(): держим ссылки, иначе задачу может собрать GC
+        self._rebuilds: Set[asyncio.Task] = set()
+
+    def get(self, day: date) -> Optional[DayDigest]:
+        return self._days.get(day)
+
+    async def ensure(self, day: date) -> DayDigest:
+        """Артефакт на день: готовый из кэша или собранный сейчас."""
+        return self._days.get(day) or await self.build(day)
+
+    async def build(self, day: date) -> DayDigest:
+        """Полная сборка: календарь → текст → (в фоне) голос."""
+        start = datetime.combine(day, datetime.min.time(), self._tz)
+        events = await asyncio.to_thread(self._list_events, start, start + timedelta(days=1))
+        text = render_agenda(events)
+        old = self._days.get(day)
+        if old is not None and old.text == text:
+            # текст не поменялся — голос переиспользуем
+            old.events, old.built_at = events, datetime.now(self._tz)
+            return old
+        self._drop_voice(old)
+        digest = DayDigest(day=day, events=events, text=text, built_at=datetime.now(self._tz))
+        self._start_voice(digest)
+        self._days[day] = digest
+        logger.info("[DIGEST] %s собран: %d событий", day, len(events))
+        return digest
+
+    async def refresh_all(self) -> None:
+        """Пересобрать всё, что в кэше (подхватывает правки, сделанные мимо бота)."""
+        self.prune(datetime.now(self._tz).date())
+        for day in list(self._days):
+            try:
+                await self.build(day)
+            except Exception as e:
+                logger.error("[DIGEST] не удалось пересобрать %s: %s", day, e)
+
+    def prune(self, before: date) -> None:
+        for day in [d for d in self._days if d < before]:
+            self._drop_voice(self._days.pop(day))
+
+    # ---- инкрементальные правки ----
+    def apply_change(self, removed: Optional[Dict] = None, added: Optional[Dict] = None) -> None:
+        """Событие удалено/добавлено/перенесено (removed → added) — поправить затронутые дни."""
+        touched = set()
+        if removed is not None:
+            day = _item_start(removed, self._tz).date()
+            digest = self._days.get(day)
+            if digest is not None:
+                digest.events = [e for e in digest.events if e["id"] != removed["id"]]
+                touched.add(day)
+        if added is not None:
+            day = _item_start(added, self._tz).date()
+            digest = self._days.get(day)
+            if digest is not None:
+                keys = [_item_start(e, self._tz) for e in digest.events]
+                pos = bisect.bisect_right(keys, _item_start(added, self._tz))
+                digest.events.insert(pos, added)
+                touched.add(day)
+        for day in touched:
+            self._rerender(self._days[day])
+
+    def invalidate(self, day: date) -> None:
+        """Правка, которую не разложить на отдельные события (серии), — пересобрать день."""
+        if day in self._days:
+            task = asyncio.create_task(self.build(day))
+            self._rebuilds.add(task)
+            task.add_done_callback(self._rebuild_done)
+
+    def cached_days(self) -> List[date]:
+        return sorted(self._days)
+
+    # ---- внутреннее ----
+    def _rerender(self, digest: DayDigest) -> None:
+        text = render_agenda(digest.events)
+        if text == digest.text:
+            return
+        digest.text = text
+        self._drop_voice(digest)
+        self._start_voice(digest)
+
+    def _start_voice(self, digest: DayDigest) -> None:
+        if not self._voice:
+            return
+
+        async def _run() -> None:
+            try:
+                digest.voice_path = await self._synthesize(digest.text)
+            except Exception as e:
+                logger.error("[DIGEST] TTS для %s не удался: %s", digest.day, e)
+
+        digest.voice_path = None
+        digest.voice_task = asyncio.create_task(_run())
+
+    def _rebuild_done(self, task: asyncio.Task) -> None:
+        self._rebuilds.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("[DIGEST] фоновая пересборка не удалась: %s", task.exception())
+
+    @staticmethod
+    def _drop_voice(digest: Optional[DayDigest]) -> None:
+        if digest is None:
+            return
+        if digest.voice_task is not None and not digest.voice_task.done():
+            digest.voice_task.cancel()
+        if digest.voice_path is not None:
+            digest.voice_path.unlink(missing_ok=True)
+        digest.voice_path = None
+        digest.voice_task = None
@@ -0,0 +1,229 @@
+# app/freebusy.py
+"""
+Индекс занятости (free/busy) поверх ближайших событий календаря.
+
+Внутри — дерево интервалов на декартовом дереве (treap), ключ (start, id).
+Каждый узел хранит агрегаты поддерева:
+  - min_start — самое раннее начало;
+  - max_end   — самый поздний конец;
+  - max_gap   — верхняя оценка самого длинного «окна» внутри поддерева.
+Благодаря этому пересечения ищутся за O(log n + k), а первое свободное
+окно нужной длины — спуском с отсечением поддеревьев без подходящих окон.
+"""
+from __future__ import annotations
+
+import random
+from datetime import datetime, time, timedelta, tzinfo
+from typing import Dict, List, Optional, Tuple
+
+
+def _ts(dt: datetime) -> float:
+    return dt.timestamp()
+
+
+def _item_bounds(item: Dict) -> Optional[Tuple[datetime, datetime]]:
+    """
+    Границы события из словаря CalendarClient ({start, end, ...}).
+    Целодневные события (только date) занятость не блокируют — None.
+    """
+    s, e = item.get("start", {}), item.get("end", {})
+    if "dateTime" not in s or "dateTime" not in e:
+        return None
+    start = datetime.fromisoformat(s["dateTime"].replace("Z", "+00:00"))
+    end = datetime.fromisoformat(e["dateTime"].replace("Z", "+00:00"))
+    return start, end
+
+
+class _Node:
+    __slots__ = (
+        "start", "end", "uid", "prio", "left", "right",
+        "min_start", "max_end", "max_gap",
+    )
+
+    def __init__(self, start: float, end: float, uid: str):
+        self.start = start
+        self.end = end
+        self.uid = uid
+        self.prio = random.random()
+        self.left: Optional[_Node] = None
+        self.right: Optional[_Node] = None
+        self.min_start = start
+        self.max_end = end
+        self.max_gap = 0.0
+
+    @property
+    def key(self) -> Tuple[float, str]:
+        return self.start, self.uid
+
+
+def _update(n: _Node) -> _Node:
+    """Пересчитать агрегаты узла по детям (порядок обхода: left, n, right)."""
+    left, right = n.left, n.right
+    gap = 0.0
+    if left is not None:
+        gap = max(left.max_gap, n.start - left.max_end)
+        reach = max(left.max_end, n.end)
+        n.min_start = left.min_start
+    else:
+        reach = n.end
+        n.min_start = n.start
+    if right is not None:
+        # right.max_gap считан без учёта «левой» части — это верхняя оценка,
+        # для отсечения при поиске её достаточно
+        gap = max(gap, right.max_gap, right.min_start - reach)
+        reach = max(reach, right.max_end)
+    n.max_end = reach
+    n.max_gap = gap
+    return n
+
+
+def _split(n: Optional[_Node], key: Tuple[float, str]) -> Tuple[Optional[_Node], Optional[_Node]]:
+    """Разрезать дерево на (< key, >= key)."""
+    if n is None:
+        return None, None
+    if n.key < key:
+        n.right, right = _split(n.right, key)
+        return _update(n), right
+    left, n.left = _split(n.left, key)
+    return left, _update(n)
+
+
+def _merge(a: Optional[_Node], b: Optional[_Node]) -> Optional[_Node]:
+    """Слить два дерева, все ключи a меньше ключей b."""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    if a.prio > b.prio:
+        a.right = _merge(a.right, b)
+        return _update(a)
+    b.left = _merge(a, b.left)
+    return _update(b)
+
+
+class FreeBusyIndex:
+    """
+    Индекс занятых интервалов. Обновляется инкрементально (add/remove)
+    при создании, переносе и удалении событий; rebuild — полная загрузка.
+    """
+
+    def __init__(self):
+        self._root: Optional[_Node] = None
+        # id события → его интервалы (у повторяющихся серий их может быть несколько)
+        self._by_id: Dict[str, List[Tuple[float, float]]] = {}
+        self._summaries: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return sum(len(v) for v in self._by_id.values())
+
+    # ---- обновление ----
+    def rebuild(self, items: List[Dict]) -> None:
+        """Полностью пересобрать индекс по списку событий из list_events."""
+        fresh = FreeBusyIndex()
+        for item in items:
+            fresh.add_item(item)
+        # подмена целиком — читатели никогда не видят полупустое дерево
+        self._root, self._by_id, self._summaries = fresh._root, fresh._by_id, fresh._summaries
+
+    def add(self, uid: str, start: datetime, end: datetime, summary: str = "") -> None:
+        s, e = _ts(start), _ts(end)
+        if e <= s:
+            return
+        node = _Node(s, e, uid)
+        left, right = _split(self._root, node.key)
+        self._root = _merge(_merge(left, node), right)
+        self._by_id.setdefault(uid, []).append((s, e))
+        self._summaries[uid] = summary
+
+    def add_item(self, item: Dict) -> bool:
+        """Добавить событие в формате CalendarClient. False — если оно целодневное."""
+        bounds = _item_bounds(item)
+        if bounds is None:
+            return False
+        self.add(item["id"], bounds[0], bounds[1], item.get("summary", ""))
+        return True
+
+    def remove(self, uid: str) -> int:
+        """Убрать все интервалы события. Возвращает число удалённых."""
+        spans = self._by_id.pop(uid, [])
+        self._summaries.pop(uid, None)
+        for s, _e in spans:
+            left, rest = _split(self._root, (s, uid))
+            _mid, right = _split(rest, (s, uid + "\0"))
+            self._root = _merge(left, right)
+        return len(spans)
+
+    # ---- запросы ----
+    def overlaps(self, start: datetime, end: datetime) -> List[Dict]:
+        """События, пересекающиеся с [start, end)."""
+        lo, hi = _ts(start), _ts(end)
+        tz = start.tzinfo
+        out: List[Dict] = []
+
+        def _walk(n: Optional[_Node]) -> None:
+            if n is None or n.max_end <= lo or n.min_start >= hi:
+                return
+            _walk(n.left)
+            if n.start < hi and n.end > lo:
+                out.append({
+                    "id": n.uid,
+                    "summary": self._summaries.get(n.uid, ""),
+                    "start": datetime.fromtimestamp(n.start, tz),
+                    "end": datetime.fromtimestamp(n.end, tz),
+                })
+            # в правом поддереве начала не раньше n.start
+            if n.start < hi:
+                _walk(n.right)
+
+        _walk(self._root)
+        return out
+
+    def _first_gap(self, lo: float, hi: float, duration: float) -> Optional[float]:
+        """Начало первого свободного окна длины duration внутри [lo, hi)."""
+
+        def _walk(n: Optional[_Node], cursor: float) -> Tuple[Optional[float], float]:
+            if n is None or n.max_end <= cursor:
+                return None, cursor
+            if n.min_start - cursor >= duration:
+                return cursor, cursor
+            if n.max_gap < duration:
+                # внутри поддерева подходящих окон нет — перескакиваем его целиком
+                return None, max(cursor, n.max_end)
+            found, cursor = _walk(n.left, cursor)
+            if found is not None or cursor + duration > hi:
+                return found, cursor
+            if n.start - cursor >= duration:
+                return cursor, cursor
+            cursor = max(cursor, n.end)
+            return _walk(n.right, cursor)
+
+        found, cursor = _walk(self._root, lo)
+        if found is None:
+            found = cursor
+        return found if found + duration <= hi else None
+
+    def first_free_slot(
+        self,
+        start: datetime,
+        end: datetime,
+        duration: timedelta,
+        work_start: time,
+        work_end: time,
+        tz: tzinfo,
+    ) -> Optional[datetime]:
+        """
+        Первое свободное окно длины duration в диапазоне [start, end),
+        только в пределах рабочих часов [work_start, work_end) каждого дня.
+        """
+        need = duration.total_seconds()
+        day = start.astimezone(tz).date()
+        last = end.astimezone(tz).date()
+        while day <= last:
+            lo = max(start, datetime.combine(day, work_start, tz))
+            hi = min(end, datetime.combine(day, work_end, tz))
+            if (hi - lo).total_seconds() >= need:
+                found = self._first_gap(_ts(lo), _ts(hi), need)
+                if found is not None:
+                    return datetime.fromtimestamp(found, tz)
+            day += timedelta(days=1)
+        return None
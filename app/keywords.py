@@ -0,0 +1,62 @@
+# app/keywords.py
+"""
+Автомат Ахо–Корасик: все вхождения всех ключевых слов за один проход по тексту.
+Стоимость прохода линейна по длине текста и не зависит от числа ключей.
+"""
+from __future__ import annotations
+
+from collections import deque
+from typing import Dict, Hashable, Iterable, Iterator, List, Tuple
+
+Output = Tuple[int, Hashable]  # (длина ключа, полезная нагрузка)
+
+
+class KeywordAutomaton:
+    def __init__(self, patterns: Iterable[Tuple[str, Hashable]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Output]] = [[]]
+        for word, payload in patterns:
+            self._add(word, payload)
+        self._build()
+
+    def _add(self, word: str, payload: Hashable) -> None:
+        state = 0
+        for ch in word:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append((len(word), payload))
+
+    def _build(self) -> None:
+        # BFS: суффиксные ссылки + наследование выходов по ним
+        # (у детей корня ссылка — на корень, она уже стоит по умолчанию)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                self._fail[nxt] = self.step(self._fail[state], ch)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def step(self, state: int, ch: str) -> int:
+        goto = self._goto
+        while state and ch not in goto[state]:
+            state = self._fail[state]
+        return goto[state].get(ch, 0)
+
+    def outputs(self, state: int) -> List[Output]:
+        return self._out[state]
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int, Hashable]]:
+        """(индекс начала, индекс конца включительно, нагрузка) для всех вхождений."""
+        state = 0
+        for i, ch in enumerate(text):
+            state = self.step(state, ch)
+            for length, payload in self._out[state]:
+                yield i - length + 1, i, payload
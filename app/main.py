@@ -1,23 +1,42 @@
 # app/main.py
 import asyncio
 import logging
+import multiprocessing
 import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from datetime import timedelta, datetime
+from datetime import timedelta, datetime, time, date
 from zoneinfo import ZoneInfo
 
 from dotenv import load_dotenv
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.jobstores.base import JobLookupError
 from apscheduler.triggers.date import DateTrigger
 
 from aiogram import Bot, Dispatcher, F
-from aiogram.types import Message, FSInputFile
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message, FSInputFile, Update
 
-from app.nlu import parse_intent
+from app.nlu import Intent, parse_cache_stats, parse_intent
 from app.calendar_client import CalendarClient
+from app.digest import AgendaDigest
+from app.freebusy import FreeBusyIndex
+from app.profiling import LoopWatchdog, MemoryTracker, SamplingProfiler
+from app.recurrence import describe, iter_occurrences, next_occurrence
+from app.speculation import Speculation, speculation_stats
 from app.storage import Storage
+from app.tenants import (
+    LinkNotConfigured,
+    Tenant,
+    TenantNotLinked,
+    TenantPool,
+    link_configured,
+    link_query,
+    linked_users,
+    token_path,
+)
 from app.stt import transcribe_voice
-from app.tts import synthesize_tts_async
+from app.tts import synthesize_tts_async, tts_latency_stats, tts_warmup
 
 
 # ---------- CONFIG ----------
@@ -30,6 +49,26 @@ BOT_TOKEN = os.getenv("TG_BOT_TOKEN")
 OWNER_ID = int(os.getenv("TG_OWNER_ID", "0"))
 REMINDER_MIN = int(os.getenv("REMINDER_MINUTES_BEFORE", "30"))        # напоминание Google
 BOT_REMINDER_MIN = int(os.getenv("BOT_REMINDER_MINUTES_BEFORE", "15"))  # напоминание бота
+FREEBUSY_HORIZON_DAYS = int(os.getenv("FREEBUSY_HORIZON_DAYS", "60"))     # на сколько дней вперёд держим занятость
+FREEBUSY_REFRESH_MIN = int(os.getenv("FREEBUSY_REFRESH_MINUTES", "30"))   # полная пересборка (правки извне бота)
+WORK_START = time.fromisoformat(os.getenv("WORK_HOURS_START", "09:00"))  # рабочие часы для поиска окна
+WORK_END = time.fromisoformat(os.getenv("WORK_HOURS_END", "19:00"))
+DIGEST_TIME = os.getenv("DIGEST_TIME", "08:00")                         # утренняя сводка; пусто — не присылать
+DIGEST_PREBUILD_MIN = int(os.getenv("DIGEST_PREBUILD_MINUTES", "10"))    # за сколько минут до отправки собрать
+DIGEST_VOICE = os.getenv("DIGEST_VOICE", "1") == "1"                    # готовить голосовую версию заранее
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./tmp_prof")                     # куда класть профили (/prof cpu)
+LOOP_WATCHDOG_MS = int(os.getenv("LOOP_WATCHDOG_MS", "0"))               # >0 — сторож event loop со старта
+STT_SPECULATE = os.getenv("STT_SPECULATE", "1") == "1"                # list/free запрашивать по гипотезам Vosk
+LIST_CHUNK_LINES = int(os.getenv("LIST_CHUNK_LINES", "20"))              # длинный список шлём частями
+CATCHUP_STALE_SEC = int(os.getenv("CATCHUP_STALE_SECONDS", "300"))       # старше — отвечаем текстом, без TTS
+CATCHUP_WORKERS = int(os.getenv("CATCHUP_WORKERS", "0")) or (os.cpu_count() or 1)
+CATCHUP_DEDUP_SEC = int(os.getenv("CATCHUP_DEDUP_SECONDS", "120"))       # повтор в пределах окна — дубль
+MULTI_TENANT = os.getenv("MULTI_TENANT", "0") == "1"                      # один процесс — много пользователей
+OAUTH_PUBLIC_URL = os.getenv("OAUTH_PUBLIC_URL", "http://localhost:8080") # адрес app/oauth_server.py для /link
+TENANT_CACHE_SIZE = int(os.getenv("TENANT_CACHE_SIZE", "64"))            # сколько клиентов календаря держим в памяти
+TENANT_CONCURRENCY = int(os.getenv("TENANT_CONCURRENCY", "8"))           # одновременно выполняемых запросов, всего
+TENANT_QUEUE_SIZE = int(os.getenv("TENANT_QUEUE_SIZE", "20"))            # очередь запросов одного пользователя
+TOKEN_REFRESH_MIN = int(os.getenv("TOKEN_REFRESH_MINUTES", "15"))        # фоновое обновление токенов Google
 
 bot = Bot(BOT_TOKEN)
 dp = Dispatcher()
@@ -41,8 +80,10 @@ scheduler = AsyncIOScheduler(
     },
 )
 
-cal = CalendarClient()
 db = Storage("sqlite.db")
+profiler = SamplingProfiler(PROFILE_DIR)
+memory = MemoryTracker()
+watchdog = LoopWatchdog((LOOP_WATCHDOG_MS or 500) / 1000)
 
 HELP_TEXT = (
     "Не поняла запрос. Вот примеры того, как можно задавать напоминания:\n\n"
@@ -61,6 +102,15 @@ HELP_TEXT = (
     "• 25 декабря в 20:00 поздравить родителей\n"
     "• сегодня в 22:00 напомни проверить логи\n"
     "• на следующей неделе во вторник в 14:00 встреча в офисе\n"
+    "• каждый понедельник в 9 планёрка\n"
+    "• по будням в 8:30 зарядка\n"
+    "• найди свободное окно завтра на час\n"
+)
+
+LINK_TEXT = (
+    "Сначала привяжите свой Google-календарь: /link"
+    if MULTI_TENANT else
+    "Нет токена Google. Авторизуйтесь через /oauth/google."
 )
 
 
@@ -72,17 +122,17 @@ def _ensure_aware(dt: datetime) -> datetime:
     return dt.astimezone(SCHED_TZ)
 
 
-async def _send_bot_reminder(summary: str, start_dt: datetime):
+async def _send_bot_reminder(chat_id: int, summary: str, start_dt: datetime):
     try:
         await bot.send_message(
-            OWNER_ID,
+            chat_id,
             f"🔔 Напоминание: «{summary}» (в {start_dt.strftime('%H:%M')})", # f"🔔 Напоминание: «{summary}» через {BOT_REMINDER_MIN} мин. (в {start_dt.strftime('%H:%M')})",
         )
     except Exception as e:
         logging.error(f"Ошибка при отправке напоминания: {e}")
 
 
-def _safe_schedule_bot_reminder(summary: str, start_dt: datetime) -> None:
+def _safe_schedule_bot_reminder(chat_id: int, summary: str, start_dt: datetime) -> None:
     """Ставит локальное напоминание от бота за BOT_REMINDER_MIN минут."""
     start = _ensure_aware(start_dt)
     remind_at = start - timedelta(minutes=BOT_REMINDER_MIN)
@@ -90,21 +140,229 @@ def _safe_schedule_bot_reminder(summary: str, start_dt: datetime) -> None:
 
     if remind_at <= now:
         # если момент напоминания уже прошёл — шлём сразу
-        asyncio.create_task(_send_bot_reminder(summary, start))
+        asyncio.create_task(_send_bot_reminder(chat_id, summary, start))
     else:
         # регистрируем асинхронную задачу напрямую
         scheduler.add_job(
             _send_bot_reminder,
             trigger=DateTrigger(run_date=remind_at),
-            args=[summary, start],   # 👈 передаём параметры
+            args=[chat_id, summary, start],   # 👈 передаём параметры
+        )
+
+
+def _schedule_series_reminder(
+    chat_id: int,
+    event_id: str,
+    summary: str,
+    rule: str,
+    dtstart: datetime,
+    after: datetime | None = None,
+) -> None:
+    """
+    Для серии держим ровно одну задачу в планировщике — напоминание о следующем
+    вхождении. Сработав, она сама ставит следующее (см. _fire_series_reminder).
+    """
+    start = _ensure_aware(dtstart)
+    lead = timedelta(minutes=BOT_REMINDER_MIN)
+    after = max(after or start - timedelta(seconds=1), datetime.now(SCHED_TZ) + lead)
+    occ = next_occurrence(rule, start, after)
+    if occ is None:
+        # серия закончилась (UNTIL/COUNT)
+        db.delete_series(event_id)
+        return
+    scheduler.add_job(
+        _fire_series_reminder,
+        trigger=DateTrigger(run_date=occ - lead),
+        args=[chat_id, event_id, summary, rule, start, occ],
+        id=f"series:{chat_id}:{event_id}",
+        replace_existing=True,
+    )
+
+
+async def _fire_series_reminder(
+    chat_id: int, event_id: str, summary: str, rule: str, dtstart: datetime, occ: datetime
+):
+    status = await _occurrence_status(chat_id, event_id, occ)
+    if status == "gone":
+        logging.info(f"[SERIES] {chat_id}: серии {event_id} больше нет — напоминания сняты")
+        _drop_series(chat_id, event_id)
+        return
+    if status == "ok":
+        await _send_bot_reminder(chat_id, summary, occ)
+    else:
+        logging.info(f"[SERIES] {chat_id}: вхождение {event_id} в {occ} удалено или перенесено — пропускаю")
+    _schedule_series_reminder(chat_id, event_id, summary, rule, dtstart, after=occ)
+
+
+async def _occurrence_status(chat_id: int, event_id: str, occ: datetime) -> str:
+    """Проверить по календарю, что вхождение ещё на месте (см. CalendarClient.occurrence_status)."""
+    try:
+        t = await tenants.get(chat_id)
+    except TenantNotLinked:
+        return "gone"
+    try:
+        return await asyncio.to_thread(t.cal.occurrence_status, event_id, occ)
+    except Exception as e:
+        # календарь недоступен — лучше напомнить лишний раз, чем пропустить
+        logging.error(f"[SERIES] {chat_id}: не удалось проверить {event_id}: {e}")
+        return "ok"
+
+
+def _drop_series(chat_id: int, event_id: str) -> None:
+    try:
+        scheduler.remove_job(f"series:{chat_id}:{event_id}")
+    except JobLookupError:
+        pass
+    db.delete_series(event_id)
+
+
+def _restore_series_reminders() -> None:
+    for event_id, summary, rule, dtstart, user_id in db.list_series():
+        # серии, созданные до многопользовательского режима, — владельца
+        _schedule_series_reminder(user_id or OWNER_ID, event_id, summary, rule, datetime.fromisoformat(dtstart))
+
+
+async def _refresh_busy_index(t: Tenant) -> None:
+    """Полная пересборка индекса занятости из календаря (загрузка пользователя + периодически)."""
+    now = datetime.now(SCHED_TZ)
+    try:
+        events = await asyncio.to_thread(
+            t.cal.list_events, now - timedelta(days=1), now + timedelta(days=FREEBUSY_HORIZON_DAYS)
         )
+    except Exception as e:
+        logging.error(f"[{t.user_id}] Не удалось обновить индекс занятости: {e}")
+        return
+    t.busy.rebuild(events)
+    logging.info(f"[FREEBUSY] {t.user_id}: индекс пересобран, {len(t.busy)} интервалов")
+
+
+async def _refresh_busy_indexes() -> None:
+    # только пользователи в кэше: вытесненные при загрузке соберут индекс заново
+    for t in tenants.cached():
+        await _refresh_busy_index(t)
+
+
+async def _refresh_digests() -> None:
+    for t in tenants.cached():
+        await t.digest.refresh_all()
+
+
+async def _refresh_tokens() -> None:
+    # запас — два интервала, чтобы токен не истёк между прогонами
+    refreshed, dropped = await tenants.refresh_credentials(timedelta(minutes=2 * TOKEN_REFRESH_MIN))
+    if refreshed or dropped:
+        logging.info(f"[TENANT] токенов обновлено: {refreshed}, сброшено: {dropped}")
+
+
+# ---------- TENANTS ----------
+def _build_tenant(user_id: int) -> Tenant:
+    """Клиент календаря и состояние пользователя (вызывается в потоке, см. TenantPool)."""
+    if MULTI_TENANT:
+        path = token_path(user_id)
+        if not path.exists():
+            raise FileNotFoundError(f"нет токена Google для {user_id}")
+        # CALENDAR_ID(S) из окружения — календари оператора; у пользователя — свой основной
+        cal = CalendarClient(calendar_id="primary", calendar_ids=["primary"], token_path=path)
+    elif user_id == OWNER_ID:
+        cal = CalendarClient()
+    else:
+        raise FileNotFoundError(f"{user_id} — не владелец")
+    return Tenant(
+        user_id=user_id,
+        cal=cal,
+        busy=FreeBusyIndex(),
+        digest=AgendaDigest(
+            cal.list_events,
+            lambda text: synthesize_tts_async(text, out_dir="./tmp_tts"),
+            SCHED_TZ,
+            voice=DIGEST_VOICE,
+        ),
+        queue=asyncio.Queue(maxsize=TENANT_QUEUE_SIZE),
+    )
+
+
+tenants = TenantPool(_build_tenant, _refresh_busy_index, TENANT_CACHE_SIZE, TENANT_CONCURRENCY)
+
+
+def _digest_users() -> list[int]:
+    return linked_users() if MULTI_TENANT else [OWNER_ID]
+
+
+async def _serve(m: Message, job, wait: bool = False) -> None:
+    """
+    Выполнить запрос в очереди пользователя: его календарь, его порядок,
+    общий лимит параллельности. wait — ждать места в очереди, а не отказывать.
+    """
+    try:
+        fut = await tenants.submit(m.from_user.id, job, wait=wait)
+    except TenantNotLinked:
+        await m.answer(LINK_TEXT)
+        return
+    except asyncio.QueueFull:
+        await m.answer("Слишком много запросов подряд — дождитесь ответа на предыдущие.")
+        return
+    await fut
+
+
+def _full_day(start: datetime | None, end: datetime | None) -> date | None:
+    """Если диапазон — ровно один календарный день, вернуть его дату."""
+    if start is None or end is None:
+        return None
+    start, end = _ensure_aware(start), _ensure_aware(end)
+    midnight = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    if start == midnight and end == midnight + timedelta(days=1):
+        return start.date()
+    return None
+
+
+async def _prebuild_digest(t: Tenant) -> None:
+    """Собрать сводку на сегодня заранее (вместе с голосом)."""
+    today = datetime.now(SCHED_TZ).date()
+    t.digest.prune(today)
+    try:
+        await t.digest.build(today)
+    except Exception as e:
+        logging.error(f"[{t.user_id}] Не удалось собрать сводку: {e}")
+
+
+async def _prebuild_digests() -> None:
+    # заранее — только тем, кто в кэше; остальным сводка соберётся при отправке
+    for t in tenants.cached():
+        await _prebuild_digest(t)
+
+
+async def _push_daily_digest(t: Tenant) -> None:
+    today = datetime.now(SCHED_TZ).date()
+    try:
+        day = await t.digest.ensure(today)
+        await bot.send_message(t.user_id, f"☀️ План на сегодня:\n{day.text}")
+        voice_path = await day.voice()
+        if voice_path is not None:
+            await bot.send_voice(t.user_id, voice=FSInputFile(str(voice_path)))
+    except Exception as e:
+        logging.error(f"[{t.user_id}] Ошибка при отправке сводки: {e}")
 
 
-async def send_reply(m: Message, text: str, reply_mode: str = "text"):
-    """Ответить текстом или голосом (с TTS fallback в текст)."""
+async def _push_daily_digests() -> None:
+    # через очереди пользователей: рассылка не отнимает у живых запросов больше общего лимита
+    futures = []
+    for user_id in _digest_users():
+        try:
+            futures.append(await tenants.submit(user_id, _push_daily_digest, wait=True))
+        except TenantNotLinked as e:
+            logging.error(f"[{user_id}] сводка не отправлена: {e}")
+    await asyncio.gather(*futures, return_exceptions=True)
+
+
+async def send_reply(m: Message, text: str, reply_mode: str = "text", voice_path: Path | None = None):
+    """
+    Ответить текстом или голосом (с TTS fallback в текст).
+    voice_path — заранее синтезированный OGG (например, из сводки дня).
+    """
     if reply_mode == "voice":
         try:
-            voice_path = await synthesize_tts_async(text, out_dir="./tmp_tts")
+            if voice_path is None:
+                voice_path = await synthesize_tts_async(text, out_dir="./tmp_tts")
             await m.answer_voice(voice=FSInputFile(str(voice_path)))
         except Exception as e:
             logging.error(f"TTS error: {e}")
@@ -114,13 +372,111 @@ async def send_reply(m: Message, text: str, reply_mode: str = "text"):
 
 
 # ---------- HANDLERS ----------
-@dp.message(F.from_user.id != OWNER_ID)
+@dp.message(F.from_user.id != OWNER_ID, lambda _m: not MULTI_TENANT)
 async def deny_for_others(m: Message):
     await m.answer("Извини, этот бот — личный помощник владельца.")
 
 
-@dp.message(F.voice)
-async def handle_voice(m: Message):
+@dp.message(Command("prof"))
+async def handle_prof(m: Message, command: CommandObject):
+    """
+    Профилирование на живом боте (только владелец — чужих отсекает deny_for_others):
+      /prof cpu [сек]         — семплирующий профайлер, пришлёт .folded для flamegraph
+      /prof mem               — снимок tracemalloc и рост с прошлого снимка
+      /prof mem off           — выключить tracemalloc
+      /prof watchdog [мс|off] — сторож блокировок event loop
+      /prof nlu               — статистика кэша разборов NLU
+      /prof tts               — задержки TTS по провайдерам и текущий порог хеджа
+      /prof tenants           — пользователи в кэше и их очереди
+    """
+    if m.from_user.id != OWNER_ID:
+        # в многопользовательском режиме deny_for_others не срабатывает
+        await m.answer("Команда доступна только владельцу бота.")
+        return
+    args = (command.args or "").split()
+    what = args[0] if args else ""
+
+    if what == "cpu":
+        seconds = float(args[1]) if len(args) > 1 else 30.0
+        await m.answer(f"Профилирую {seconds:.0f} с…")
+        try:
+            path = await profiler.run(seconds)
+        except RuntimeError as e:
+            await m.answer(str(e))
+            return
+        await m.answer_document(FSInputFile(str(path)))
+
+    elif what == "mem":
+        if len(args) > 1 and args[1] == "off":
+            memory.stop()
+            await m.answer("tracemalloc выключен.")
+        else:
+            await m.answer(memory.snapshot())
+
+    elif what == "watchdog":
+        if len(args) > 1 and args[1] == "off":
+            watchdog.stop()
+            await m.answer("Сторож event loop выключен.")
+        else:
+            if len(args) > 1:
+                watchdog.stop()
+                watchdog.threshold = int(args[1]) / 1000
+            watchdog.start()
+            await m.answer(f"Сторож event loop включён, порог {watchdog.threshold * 1000:.0f} мс.")
+
+    elif what == "nlu":
+        st = parse_cache_stats()
+        sp = speculation_stats()
+        await m.answer(
+            f"Кэш NLU: {st['size']} записей, попаданий {st['hits']}, промахов {st['misses']} "
+            f"(не кэшируемых {st['uncacheable']}), hit rate {st['hit_rate']:.0%}.\n"
+            f"Разбор: {st['avg_miss_ms']:.1f} мс без кэша, {st['avg_hit_ms']:.2f} мс из кэша; "
+            f"сэкономлено {st['saved_sec']:.1f} с.\n"
+            f"Предзапросы по гипотезам STT: {sp['started']}, пригодились {sp['committed']} "
+            f"({sp['hit_rate']:.0%}), выброшены {sp['discarded']}."
+        )
+
+    elif what == "tts":
+        st = tts_latency_stats()
+        lines = [f"Хедж через {st.pop('hedge')['delay']:.2f} с"]
+        for name, h in st.items():
+            if h["p50"] is None:
+                lines.append(f"{name}: нет данных")
+            else:
+                lines.append(f"{name}: p50 ≤ {h['p50']:.2f} с, p95 ≤ {h['p95']:.2f} с ({h['samples']:.0f} замеров)")
+        await m.answer("\n".join(lines))
+
+    elif what == "tenants":
+        cached = tenants.cached()
+        busy_now = [t for t in cached if not t.idle]
+        queued = sum(t.queue.qsize() for t in cached)
+        await m.answer(
+            f"В кэше {len(cached)} из {TENANT_CACHE_SIZE} пользователей (привязано: {len(_digest_users())}), "
+            f"заняты: {len(busy_now)}, в очередях: {queued}, лимит параллельности: {TENANT_CONCURRENCY}."
+        )
+
+    else:
+        await m.answer(handle_prof.__doc__)
+
+
+@dp.message(Command("link"))
+async def handle_link(m: Message):
+    """Подписанная ссылка на привязку Google-аккаунта (многопользовательский режим)."""
+    if not MULTI_TENANT:
+        await m.answer("Бот работает для одного владельца: Google-аккаунт привязывается при установке.")
+        return
+    user_id = m.from_user.id
+    try:
+        url = f"{OAUTH_PUBLIC_URL}/oauth/google?{link_query(user_id)}"
+    except LinkNotConfigured:
+        await m.answer("Привязка аккаунтов не настроена (нет LINK_SECRET). Сообщите администратору бота.")
+        return
+    # после повторной привязки клиент должен перечитать токен
+    tenants.drop(user_id)
+    await m.answer(f"Откройте ссылку и разрешите доступ к календарю (действует ограниченное время):\n{url}")
+
+
+async def _download_voice(m: Message) -> Path:
     # сохраняем voice в ./tmp
     tmp_path = Path(f"./tmp/{m.voice.file_unique_id}.ogg")
     tmp_path.parent.mkdir(parents=True, exist_ok=True)
@@ -130,76 +486,367 @@ async def handle_voice(m: Message):
         await bot.download(file, destination=tmp_path)
     except Exception:
         await bot.download_file(file.file_path, destination=tmp_path)
+    return tmp_path
 
-    # STT → текст
+
+@dp.message(F.voice)
+async def handle_voice(m: Message):
+    await _serve(m, lambda t: _process_voice(t, m))
+
+
+async def _process_voice(t: Tenant, m: Message):
+    tmp_path = await _download_voice(m)
+
+    # «через 10 минут» — от момента получения, одинаково для гипотез и итога
+    now = datetime.now(SCHED_TZ).replace(tzinfo=None)
+    spec = Speculation(
+        lambda s, cache=True: parse_intent(s, tz=TZ, now=now, cache=cache),
+        lambda intent: _prefetch(t, intent),
+    )
+    on_partial = None
+    if STT_SPECULATE:
+        loop = asyncio.get_running_loop()
+        on_partial = lambda partial: loop.call_soon_threadsafe(spec.feed, partial)
+
+    # STT → текст (в потоке: пока декодируем, по гипотезам уже идут запросы)
     try:
-        text = transcribe_voice(str(tmp_path))
+        text = await asyncio.to_thread(transcribe_voice, str(tmp_path), on_partial=on_partial)
     except Exception as e:
+        spec.cancel()
         await m.answer(f"Не смог распознать голос: {e}")
         return
 
     logging.info(f"[STT] распознано: {text!r}")
 
     # обработка текста, ответ голосом
-    await process_text(m, text, reply_mode="voice")
+    intent, prefetched = spec.commit(text)
+    await process_text(t, m, text, reply_mode="voice", intent=intent, prefetched=prefetched)
 
 
 @dp.message(F.text)
 async def handle_text(m: Message):
-    await process_text(m, m.text, reply_mode="text")
+    await _serve(m, lambda t: process_text(t, m, m.text, reply_mode="text"))
 
 
 # ---------- CORE ----------
-async def process_text(m: Message, text: str, reply_mode: str = "text"):
-    intent = parse_intent(text, tz=TZ)
+def _find_free_slot(t: Tenant, intent: Intent) -> datetime | None:
+    return t.busy.first_free_slot(
+        _ensure_aware(intent.range_start),
+        _ensure_aware(intent.range_end),
+        intent.duration,
+        WORK_START,
+        WORK_END,
+        SCHED_TZ,
+    )
+
+
+async def _prefetch(t: Tenant, intent: Intent):
+    """То же чтение календаря, что сделает process_text для list/free, — заранее."""
+    if intent.type == "free":
+        return _find_free_slot(t, intent)
+    day = _full_day(intent.range_start, intent.range_end)
+    if day is not None:
+        return await t.digest.ensure(day)
+    return [ev async for ev in t.cal.stream_events(intent.range_start, intent.range_end)]
+
+
+async def _replay(prefetched: asyncio.Task):
+    for ev in await prefetched:
+        yield ev
+
+
+async def process_text(
+    t: Tenant,
+    m: Message,
+    text: str,
+    reply_mode: str = "text",
+    intent: Intent | None = None,
+    prefetched: asyncio.Task | None = None,
+):
+    """
+    t — пользователь (его календарь, индекс занятости, сводка); выполняется в его очереди.
+    intent — уже готовый разбор (например, из догоняющего режима); иначе разбираем сами.
+    prefetched — задача _prefetch(t, intent), запущенная заранее по гипотезе STT.
+    """
+    intent = intent or parse_intent(text, tz=TZ)
 
     if intent.type == "create":
         if not intent.start:
             await send_reply(m, HELP_TEXT, reply_mode)
             return
 
-        event = cal.create_event(
+        # проверка пересечений — по индексу, без похода в календарь
+        conflicts = t.busy.overlaps(_ensure_aware(intent.start), _ensure_aware(intent.end or intent.start))
+
+        # вызовы Google — в потоке: event loop общий для всех пользователей
+        event = await asyncio.to_thread(
+            t.cal.create_event,
             intent.title,
             intent.start,
             intent.end,
             reminder_minutes=REMINDER_MIN,  # уведомление Google (popup)
+            recurrence=intent.recurrence,
         )
 
-        text_ok = (
-            f"Создала событие «{event['summary']}» на {event['when_human']}. "
-            f"Напомню за {BOT_REMINDER_MIN} мин."
-        )
+        if intent.recurrence:
+            # в индекс занятости — только вхождения в пределах горизонта
+            start = _ensure_aware(intent.start)
+            length = _ensure_aware(intent.end) - start
+            horizon = datetime.now(SCHED_TZ) + timedelta(days=FREEBUSY_HORIZON_DAYS)
+            for occ in iter_occurrences(intent.recurrence, start, horizon):
+                t.busy.add(event["id"], occ, occ + length, event["summary"])
+            text_ok = (
+                f"Создала повторяющееся событие «{event['summary']}» ({describe(intent.recurrence)}), "
+                f"первое — {event['when_human']}. Напомню за {BOT_REMINDER_MIN} мин. до каждого."
+            )
+        else:
+            t.busy.add_item(event["item"])
+            text_ok = (
+                f"Создала событие «{event['summary']}» на {event['when_human']}. "
+                f"Напомню за {BOT_REMINDER_MIN} мин."
+            )
+        if conflicts:
+            names = ", ".join(f"«{c['summary']}» ({c['start'].strftime('%H:%M')})" for c in conflicts)
+            text_ok += f" Внимание: пересекается с {names}."
         await send_reply(m, text_ok, reply_mode)
 
         # телеграм-напоминание от бота
-        _safe_schedule_bot_reminder(event['summary'], intent.start)
+        if intent.recurrence:
+            start = _ensure_aware(intent.start)
+            db.add_series(event["id"], event["summary"], intent.recurrence, start.isoformat(), t.user_id)
+            _schedule_series_reminder(t.user_id, event["id"], event["summary"], intent.recurrence, start)
+        else:
+            _safe_schedule_bot_reminder(t.user_id, event['summary'], intent.start)
+
+        # сводка дня: разовое событие правим на месте, серию — пересборкой затронутых дней
+        if intent.recurrence:
+            cached = t.digest.cached_days()
+            if cached:
+                until = datetime.combine(cached[-1] + timedelta(days=1), time.min, SCHED_TZ)
+                for occ in iter_occurrences(intent.recurrence, _ensure_aware(intent.start), until):
+                    t.digest.invalidate(occ.date())
+        else:
+            t.digest.apply_change(added=event["item"])
 
     elif intent.type == "list":
-        events = cal.list_events(intent.range_start, intent.range_end)
-        if not events:
-            await send_reply(m, "Ничего не запланировано.", reply_mode)
+        day = _full_day(intent.range_start, intent.range_end)
+        if day is not None:
+            # целый день — отдаём предрассчитанную сводку (текст + готовый голос)
+            agenda = await (prefetched if prefetched is not None else t.digest.ensure(day))
+            voice_path = await agenda.voice() if reply_mode == "voice" else None
+            await send_reply(m, agenda.text, reply_mode, voice_path=voice_path)
+            return
+
+        # остальное — потоком из всех календарей: первые строки уходят,
+        # пока медленные календари ещё листаются
+        lines: list[str] = []
+        sent = False
+        if prefetched is not None:
+            events = _replay(prefetched)
         else:
-            pretty = "\n".join([e["human"] for e in events])
-            await send_reply(m, pretty, reply_mode)
+            events = t.cal.stream_events(intent.range_start, intent.range_end)
+        async for ev in events:
+            lines.append(ev["human"])
+            if reply_mode == "text" and len(lines) >= LIST_CHUNK_LINES:
+                await m.answer("\n".join(lines))
+                lines, sent = [], True
+        if lines:
+            await send_reply(m, "\n".join(lines), reply_mode)
+        elif not sent:
+            await send_reply(m, "Ничего не запланировано.", reply_mode)
+
+    elif intent.type == "move" and intent.new_start is None:
+        await send_reply(m, "На когда перенести? Например: «перенеси планёрку на завтра в 10».", reply_mode)
 
     elif intent.type == "move":
-        res = cal.move_event(intent.selector, intent.new_start, intent.new_end)
+        res = await asyncio.to_thread(t.cal.move_event, intent.selector, intent.new_start, intent.new_end)
+        if "id" in res:
+            t.busy.remove(res["id"])
+            t.busy.add_item(res["item"])
+            t.digest.apply_change(removed=res["old"], added=res["item"])
+            if res["item"].get("series_id"):
+                # вхождение серии: по старому времени напоминание пропустится
+                # (_fire_series_reminder), по новому — ставим разовое
+                _safe_schedule_bot_reminder(t.user_id, res["item"]["summary"], intent.new_start)
         await send_reply(m, res["human"], reply_mode)
 
     elif intent.type == "delete":
-        res = cal.delete_event(intent.selector)
+        # «удали все планёрки» — вся серия, иначе только ближайшее вхождение
+        res = await asyncio.to_thread(t.cal.delete_event, intent.selector, intent.series)
+        if res.get("series_deleted"):
+            _drop_series(t.user_id, res["id"])
+            # вхождения серии лежат в индексе и сводке под своими id — проще пересобрать
+            await _refresh_busy_index(t)
+            await t.digest.refresh_all()
+        elif "id" in res:
+            # удалённое вхождение серии пропустит _fire_series_reminder
+            t.busy.remove(res["id"])
+            t.digest.apply_change(removed=res["item"])
         await send_reply(m, res["human"], reply_mode)
 
+    elif intent.type == "free":
+        slot = await prefetched if prefetched is not None else _find_free_slot(t, intent)
+        if slot is None:
+            await send_reply(m, "Свободного окна не нашла.", reply_mode)
+        else:
+            slot_end = slot + intent.duration
+            await send_reply(
+                m,
+                f"Свободное окно: {slot.strftime('%d.%m.%Y %H:%M')}–{slot_end.strftime('%H:%M')}",
+                reply_mode,
+            )
+
     else:
         await send_reply(m, HELP_TEXT, reply_mode)
 
 
+# ---------- CATCH-UP ----------
+async def _drain_pending_updates() -> list[Update]:
+    """Забрать всё, что накопилось, пока бот лежал (и подтвердить — polling их не повторит)."""
+    updates: list[Update] = []
+    offset = None
+    while True:
+        batch = await bot.get_updates(offset=offset, limit=100, timeout=0)
+        if not batch:
+            return updates
+        updates += batch
+        offset = batch[-1].update_id + 1
+
+
+def _is_user_request(u: Update) -> bool:
+    m = u.message
+    if m is None or m.from_user is None:
+        return False
+    if not MULTI_TENANT and m.from_user.id != OWNER_ID:
+        return False
+    return bool(m.voice) or bool(m.text and not m.text.startswith("/"))
+
+
+async def _catch_up() -> None:
+    """
+    Догоняющий режим после простоя: накопившиеся сообщения пользователей
+    распознаются и разбираются параллельно (время отсчёта — момент отправки),
+    повторы отбрасываются, на устаревшие сообщения отвечаем текстом без TTS.
+    Команды и чужие сообщения идут обычным путём через диспетчер.
+    """
+    updates = await _drain_pending_updates()
+    if not updates:
+        return
+    started = datetime.now(SCHED_TZ)
+    logging.info(f"[CATCHUP] накопилось обновлений: {len(updates)}")
+
+    requests = [u.message for u in updates if _is_user_request(u)]
+    for u in updates:
+        if not _is_user_request(u):
+            await dp.feed_update(bot, u)
+
+    # голос → текст, параллельно (модель Vosk общая, распознаватели — свои)
+    stt_slots = asyncio.Semaphore(CATCHUP_WORKERS)
+
+    async def _text_of(m: Message) -> str:
+        if not m.voice:
+            return m.text
+        async with stt_slots:
+            path = await _download_voice(m)
+            return await asyncio.to_thread(transcribe_voice, str(path))
+
+    texts = await asyncio.gather(*(_text_of(m) for m in requests), return_exceptions=True)
+
+    # повтор той же команды тем же пользователем вскоре после выполненной — дубль
+    # (переотправил, не дождавшись ответа); та же фраза через час — новая просьба
+    jobs: list[tuple[Message, str]] = []
+    done_at: dict[tuple[int, str], datetime] = {}
+    for m, text in zip(requests, texts):
+        if isinstance(text, Exception):
+            logging.error(f"[CATCHUP] не удалось распознать сообщение {m.message_id}: {text}")
+            continue
+        key = (m.from_user.id, " ".join(text.lower().split()))
+        if not key[1]:
+            continue
+        prev = done_at.get(key)
+        if prev is not None and m.date - prev <= timedelta(seconds=CATCHUP_DEDUP_SEC):
+            logging.info(f"[CATCHUP] пропускаю повтор: {text!r}")
+            continue
+        done_at[key] = m.date
+        jobs.append((m, text))
+
+    # NLU — по процессам (dateparser упирается в CPU); «через 10 минут» считаем от отправки
+    def _sent_at(m: Message) -> datetime:
+        return m.date.astimezone(SCHED_TZ).replace(tzinfo=None)
+
+    loop = asyncio.get_running_loop()
+    workers = min(CATCHUP_WORKERS, len(jobs))
+    if workers > 1:
+        # не fork: процесс уже с потоками (планировщик, пулы клиентов) и открытыми
+        # сокетами. forkserver/spawn импортируют __main__ родителя — поэтому бот
+        # запускается через python -m app (app/__main__.py), а не python -m app.main
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        ctx = multiprocessing.get_context(method)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+            intents = await asyncio.gather(*(
+                loop.run_in_executor(pool, parse_intent, text, TZ, _sent_at(m)) for m, text in jobs
+            ))
+    else:
+        intents = [parse_intent(text, tz=TZ, now=_sent_at(m)) for m, text in jobs]
+
+    # побочные эффекты (календарь, ответы) — через очереди пользователей:
+    # у каждого в исходном порядке, разные пользователи — параллельно
+    async def _run(m: Message, text: str, intent: Intent) -> None:
+        stale = started - m.date > timedelta(seconds=CATCHUP_STALE_SEC)
+        reply_mode = "voice" if m.voice and not stale else "text"
+        try:
+            await _serve(
+                m,
+                lambda t: process_text(t, m, text, reply_mode=reply_mode, intent=intent),
+                wait=True,
+            )
+        except Exception as e:
+            logging.error(f"[CATCHUP] ошибка обработки {m.message_id}: {e}")
+
+    by_user: dict[int, list] = {}
+    for (m, text), intent in zip(jobs, intents):
+        by_user.setdefault(m.from_user.id, []).append((m, text, intent))
+
+    async def _run_user(items: list) -> None:
+        for m, text, intent in items:
+            await _run(m, text, intent)
+
+    await asyncio.gather(*(_run_user(items) for items in by_user.values()))
+
+    took = (datetime.now(SCHED_TZ) - started).total_seconds()
+    logging.info(f"[CATCHUP] обработано {len(jobs)} из {len(requests)} сообщений за {took:.1f} с")
+
+
 # ---------- ENTRY ----------
 async def main():
+    if MULTI_TENANT and not link_configured():
+        raise SystemExit("MULTI_TENANT=1 требует LINK_SECRET: без него /link не выдаст ссылку привязки")
     scheduler.start()
+    if LOOP_WATCHDOG_MS > 0:
+        watchdog.start()
+    _restore_series_reminders()
+    await tts_warmup()
+    if not MULTI_TENANT:
+        # владелец загружается сразу: индекс занятости и сводка готовы к первому запросу;
+        # в многопользовательском режиме пользователи грузятся лениво, при первом запросе
+        await _prebuild_digest(await tenants.get(OWNER_ID))
+    scheduler.add_job(_refresh_busy_indexes, "interval", minutes=FREEBUSY_REFRESH_MIN)
+    scheduler.add_job(_refresh_tokens, "interval", minutes=TOKEN_REFRESH_MIN)
+
+    # сводка дня: обновлять вместе с индексом, пересобрать перед отправкой
+    scheduler.add_job(_refresh_digests, "interval", minutes=FREEBUSY_REFRESH_MIN)
+    if DIGEST_TIME:
+        push_at = datetime.combine(date.today(), time.fromisoformat(DIGEST_TIME))
+        build_at = push_at - timedelta(minutes=DIGEST_PREBUILD_MIN)
+        scheduler.add_job(_prebuild_digests, "cron", hour=build_at.hour, minute=build_at.minute)
+        scheduler.add_job(_push_daily_digests, "cron", hour=push_at.hour, minute=push_at.minute)
+
+    await _catch_up()
     await dp.start_polling(bot)
 
 
 if __name__ == "__main__":
+    # по-старому тоже работает, но процессы догоняющего режима повторят импорт
+    # этого модуля целиком — запускайте python -m app
     asyncio.run(main())
 
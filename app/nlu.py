@@ -1,29 +1,40 @@
 # app/nlu.py
 from __future__ import annotations
 
+import os
 import re
-from dataclasses import dataclass
+import threading
+import time as _time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field, replace
 from datetime import datetime, timedelta
-from typing import Optional, List, Tuple
+from typing import Callable, Dict, Optional, List, Tuple
 
 import dateparser
 from dateparser.search import search_dates
 
+from app.keywords import KeywordAutomaton
+from app.recurrence import WEEKDAY_CODES, next_occurrence
+
 
 @dataclass
 class Intent:
-    type: str  # create | list | move | delete | unknown
+    type: str  # create | list | move | delete | free | unknown
     # create
     title: Optional[str] = None
     start: Optional[datetime] = None
     end: Optional[datetime] = None
+    recurrence: Optional[str] = None  # RRULE, если событие повторяющееся; start — первое вхождение
     # list
     range_start: Optional[datetime] = None
     range_end: Optional[datetime] = None
-    # move/delete (упрощённо)
+    # move/delete: selector — слова названия («планёрку»), new_start — куда перенести
     selector: Optional[str] = None
     new_start: Optional[datetime] = None
     new_end: Optional[datetime] = None
+    series: bool = False  # delete: вся серия («удали все планёрки»), иначе ближайшее вхождение
+    # free (поиск свободного окна в range_start..range_end)
+    duration: Optional[timedelta] = None
 
 
 # ---------- нормализация времени ----------
@@ -32,6 +43,21 @@ class Intent:
 _RE_HH_DOT_MM   = re.compile(r"\b(\d{1,2})\.(\d{2})\b")
 _RE_HH_SPACE_MM = re.compile(r"\b(\d{1,2})\s+(\d{2})\b")
 _RE_HHMM        = re.compile(r"(?<![\d.:/\-])(\d{3,4})(?![\d.:/\-])")  # не рядом с разделителями дат
+_RE_CLOCK       = re.compile(r"\b\d{1,2}:\d{2}\b")
+
+# голый час «в 9»: только если другого времени в тексте нет и это точно время —
+# «в 9 утра», «в 7 вечера», «в 3 часа» или «… в 9» в конце фразы
+# (иначе «в 3 корпусе», «в 2 магазинах» становились бы часами)
+HOUR_UNITS = {"утра": 0, "дня": 12, "вечера": 12, "ночи": 0, "час": 0, "часа": 0, "часов": 0}
+_RE_AT_HH = re.compile(
+    r"\bв\s+(\d{1,2})\b(?![:.]\d)(?:\s+(" + "|".join(HOUR_UNITS) + r")\b|(?=\s*[.!?]?\s*$))",
+    flags=re.IGNORECASE,
+)
+# в повторениях («каждый понедельник в 9 планёрка») время обязательно — число после «в» и есть час
+_RE_AT_HH_LOOSE = re.compile(
+    r"\bв\s+(\d{1,2})\b(?![:.]\d)(?:\s+(" + "|".join(HOUR_UNITS) + r")\b)?",
+    flags=re.IGNORECASE,
+)
 
 WEEKDAYS = [
     "понедельник", "вторник", "среда", "четверг",
@@ -51,17 +77,29 @@ STOP_WORDS = set([
     "создай", "создать", "сделай", "сделать", "поставь", "поставить",
 ]) | set(WEEKDAYS)
 
-# чтобы вырезать из текста саму «временную часть» при построении title
+# чтобы вырезать из текста саму «временную часть» при построении title:
+# «в 15:15», «в 15.15», «в 1515», «в 15 15», «в 15» — как последовательности форм токенов
+# (порядок важен: длинные шаблоны раньше коротких)
+# «в 9» — не здесь: голый час решает _bare_hour_block (по тем же правилам, что _RE_AT_HH)
 _TIME_PATTERNS = [
-    r"\bв\s*\d{1,2}:\d{2}\b",
-    r"\bв\s*\d{1,2}\.\d{2}\b",
-    r"\bв\s*\d{3,4}\b",
-    r"\bв\s*\d{1,2}\s+\d{2}\b",
+    ("в", "HH:MM"),
+    ("в", "HH.MM"),
+    ("в", "HHMM"),
+    ("в", "HH", "MM"),
 ]
-_RE_TIME_BLOCKS = [re.compile(pat, flags=re.IGNORECASE) for pat in _TIME_PATTERNS]
 
 
-def _normalize_time_tokens(text: str) -> str:
+def _hour_with_unit(hh: int, unit: Optional[str]) -> int:
+    """«7 вечера» → 19, «12 ночи» → 0."""
+    unit = (unit or "").lower()
+    if HOUR_UNITS.get(unit) and hh < 12:
+        return hh + 12
+    if unit == "ночи" and hh == 12:
+        return 0
+    return hh
+
+
+def _normalize_time_tokens(text: str, loose: bool = False) -> str:
     s = text
 
     # HH.MM → HH:MM
@@ -86,24 +124,286 @@ def _normalize_time_tokens(text: str) -> str:
         return m.group(0)
     s = _RE_HHMM.sub(_hhmm, s)
 
+    # «в 9» → «в 09:00» (голый час без минут dateparser не понимает)
+    def _at_hh(m: re.Match) -> str:
+        hh = int(m.group(1))
+        if 0 <= hh <= 23:
+            return f"в {_hour_with_unit(hh, m.group(2)):02d}:00"
+        return m.group(0)
+    if not _RE_CLOCK.search(s):
+        s = (_RE_AT_HH_LOOSE if loose else _RE_AT_HH).sub(_at_hh, s, count=1)
+
     return s
 
 
-def _clean_title(text: str) -> str:
-    s = text.lower()
+# просмотр расписания: «что у меня завтра», «покажи план»
+LIST_KEYWORDS = ["что у меня", "расписан", "покажи план"]
+
+# поиск свободного окна: «найди свободное окно завтра на час»
+FREE_KEYWORDS = [
+    "свободное окно", "свободное время", "свободный слот",
+    "найди окно", "найди время", "когда я свобод",
+]
+
+_RE_DURATION = re.compile(r"\bна\s+(\d+)\s*(мин\w*|час\w*)")
+DEFAULT_FREE_DURATION = timedelta(hours=1)
+
+
+def _parse_duration(low: str) -> Optional[timedelta]:
+    """«на 30 минут» / «на 2 часа» / «на час» / «на полчаса» / «на полтора часа»."""
+    if "полтора час" in low:
+        return timedelta(minutes=90)
+    if "полчаса" in low:
+        return timedelta(minutes=30)
+    m = _RE_DURATION.search(low)
+    if m:
+        n = int(m.group(1))
+        return timedelta(hours=n) if m.group(2).startswith("час") else timedelta(minutes=n)
+    if re.search(r"\bна\s+час\b", low):
+        return timedelta(hours=1)
+    return None
+
+
+# повторения: «каждый понедельник», «по средам и пятницам», «по будням», «ежедневно»
+# (основа дня недели → код BYDAY и именительный падеж для dateparser)
+_WEEKDAY_STEMS = [
+    ("понедельн", "понедельник"), ("вторн", "вторник"), ("сред", "среда"),
+    ("четверг", "четверг"), ("пятниц", "пятница"), ("суббот", "суббота"),
+    ("воскресен", "воскресенье"),
+]
+_RE_EVERY_DAY = re.compile(r"\b(?:каждый\s+день|ежедневно)\b")
+_RE_WORKDAYS = re.compile(r"\b(?:по\s+будням|каждый\s+будний\s+день)\b")
+_RE_EVERY_WEEK = re.compile(r"\b(?:каждую\s+неделю|еженедельно)\b")
+_RE_EVERY_MONTH = re.compile(r"\b(?:каждый\s+месяц|ежемесячно)\b")
+_RE_EVERY_WEEKDAY = re.compile(r"\bкажд(?:ый|ую|ое)\s+(\w+)")
+_RE_BY_WEEKDAYS = re.compile(r"\bпо\s+(\w+ам(?:(?:\s*,\s*|\s+и\s+)\w+ам)*)\b")
+
+
+def _weekday_index(word: str) -> Optional[int]:
+    for i, (stem, _nom) in enumerate(_WEEKDAY_STEMS):
+        if word.startswith(stem):
+            return i
+    return None
+
+
+def _parse_recurrence(text: str) -> Optional[Tuple[str, str]]:
+    """
+    Ищет описание повторения. Возвращает (RRULE, текст без него) —
+    оставшийся текст дальше идёт в обычный разбор времени и названия.
+    """
+    low = text.lower()
+    for rx, rule in (
+        (_RE_EVERY_DAY, "RRULE:FREQ=DAILY"),
+        (_RE_WORKDAYS, "RRULE:FREQ=WEEKLY;BYDAY=" + ",".join(WEEKDAY_CODES[:5])),
+        (_RE_EVERY_WEEK, "RRULE:FREQ=WEEKLY"),
+        (_RE_EVERY_MONTH, "RRULE:FREQ=MONTHLY"),
+    ):
+        m = rx.search(low)
+        if m:
+            return rule, text[: m.start()] + " " + text[m.end():]
+
+    days: List[int] = []
+    m = _RE_EVERY_WEEKDAY.search(low)
+    if m:
+        idx = _weekday_index(m.group(1))
+        if idx is not None:
+            days = [idx]
+    if not days:
+        m = _RE_BY_WEEKDAYS.search(low)
+        if m:
+            words = re.split(r"\s*,\s*|\s+и\s+", m.group(1))
+            found = [_weekday_index(w) for w in words]
+            if found and all(i is not None for i in found):
+                days = sorted(set(found))
+    if not days:
+        return None
+
+    rule = "RRULE:FREQ=WEEKLY;BYDAY=" + ",".join(WEEKDAY_CODES[i] for i in days)
+    # день недели оставляем (в именительном) — он стоп-слово и не попадёт в название
+    rest = text[: m.start()] + " " + _WEEKDAY_STEMS[days[0]][1] + " " + text[m.end():]
+    return rule, rest
+
+
+# move/delete: в selector не попадают сама команда и слова «про серию»
+COMMAND_WORDS = {
+    "перенеси", "перенести", "передвинь", "сдвинь",
+    "удали", "удалить", "отмени", "отменить", "убери",
+}
+WHOLE_SERIES_WORDS = {"все", "всю", "серию", "каждую", "каждый", "каждое", "всегда", "повторения"}
 
-    # вырезаем явные временные блоки «в 15:15», «в 15 15», «в 1515», «в 15.15»
-    for rx in _RE_TIME_BLOCKS:
-        s = rx.sub(" ", s)
 
-    # токенизируем и убираем стоп-слова
-    tokens = [t for t in re.split(r"\s+", s) if t]
-    tokens = [t for t in tokens if t not in STOP_WORDS]
+def _selector(scan: _Scan) -> str:
+    """Слова названия: без команды, «все/серию», дней недели, месяцев и чисел (это про время)."""
+    return " ".join(
+        w for w in scan.title_tokens
+        if w not in COMMAND_WORDS
+        and w not in WHOLE_SERIES_WORDS
+        and _weekday_index(w) is None
+        and not any(w.startswith(stem) for stem in MONTH_STEMS)
+        and not any(ch.isdigit() for ch in w)
+    )
 
-    # собираем обратно
-    s = " ".join(tokens)
-    s = re.sub(r"[^\wа-яё0-9\s\-]+", "", s, flags=re.IGNORECASE)
-    s = re.sub(r"\s{2,}", " ", s).strip()
+
+# ---------- однопроходный сканер ----------
+
+# ключи интентов — подстроки (как раньше с `kw in low`)
+MOVE_KEYWORDS = ["перенеси", "перенос"]
+DELETE_KEYWORDS = ["удали", "отмени"]
+RECUR_KEYWORDS = ["кажд", "ежедневн", "еженедельн", "ежемесячн", "по будням"] + [
+    stem for stem, _nom in _WEEKDAY_STEMS
+]
+DAY_MARKERS = ["сегодня", "завтра", "послезавтра", "через"]
+# для кэша разборов: чем якорится дата — днём недели или явной датой
+MONTH_STEMS = [
+    "январ", "феврал", "март", "апрел", "мая", "июн", "июл",
+    "август", "сентябр", "октябр", "ноябр", "декабр",
+]
+
+
+def _build_automaton() -> KeywordAutomaton:
+    patterns = []
+    for intent, words in (
+        ("free", FREE_KEYWORDS),
+        ("list", LIST_KEYWORDS),
+        ("move", MOVE_KEYWORDS),
+        ("delete", DELETE_KEYWORDS),
+        ("recur", RECUR_KEYWORDS),
+    ):
+        patterns += [(w, ("intent", intent)) for w in words]
+    patterns += [(w, ("mark", w)) for w in DAY_MARKERS]
+    patterns += [(stem, ("mark", "weekday")) for stem, _nom in _WEEKDAY_STEMS]
+    patterns += [(stem, ("mark", "month")) for stem in MONTH_STEMS]
+    # стоп-слова (в т.ч. дни недели) — только целым токеном, это проверяет сканер
+    patterns += [(w, ("stop", None)) for w in STOP_WORDS]
+    return KeywordAutomaton(patterns)
+
+
+_AUTOMATON = _build_automaton()
+
+
+@dataclass
+class _Scan:
+    votes: Counter = field(default_factory=Counter)      # интент → число сработавших ключей
+    marks: set = field(default_factory=set)              # «сегодня» / «через» / weekday / month …
+    time_spans: List[Tuple[int, int]] = field(default_factory=list)  # «в 15:15» и т.п., [start, end)
+    title_tokens: List[str] = field(default_factory=list)
+
+
+def _token_shape(tok: str) -> Optional[str]:
+    """Форма числового токена для _TIME_PATTERNS (хвостовая пунктуация не мешает)."""
+    tok = tok.rstrip(",.;!?»)")
+    if tok.isdigit():
+        if len(tok) <= 2:
+            return "HH"
+        return "HHMM" if len(tok) <= 4 else None
+    for sep, shape in ((":", "HH:MM"), (".", "HH.MM")):
+        hh, found, mm = tok.partition(sep)
+        if found and hh.isdigit() and len(hh) <= 2 and mm.isdigit() and len(mm) == 2:
+            return shape
+    return None
+
+
+def _shape_is(tok: str, shape: str) -> bool:
+    if shape == "MM":
+        tok = tok.rstrip(",.;!?»)")
+        return tok.isdigit() and len(tok) == 2
+    return _token_shape(tok) == shape
+
+
+def _time_block_len(tokens: List[Tuple[int, int, str, bool]], i: int) -> int:
+    """Сколько токенов с позиции i занимает временной блок (0 — не блок)."""
+    tok = tokens[i][2]
+    for pattern in _TIME_PATTERNS:
+        if tok == pattern[0]:
+            rest, n = pattern[1:], 1
+        elif tok.startswith(pattern[0]) and _shape_is(tok[len(pattern[0]):], pattern[1]):
+            # слитно: «в15:15»
+            rest, n = pattern[2:], 1
+        else:
+            continue
+        if i + n + len(rest) > len(tokens):
+            continue
+        if all(_shape_is(tokens[i + n + k][2], shape) for k, shape in enumerate(rest)):
+            return n + len(rest)
+    return 0
+
+
+def _bare_hour_block(tokens: List[Tuple[int, int, str, bool]], loose: bool) -> Optional[Tuple[int, int]]:
+    """Голый час «в 9 [утра]» — [i, j) по токенам; те же правила, что у _RE_AT_HH(_LOOSE)."""
+    for i in range(len(tokens) - 1):
+        num = tokens[i + 1][2].rstrip(",.;!?»)")
+        if tokens[i][2] != "в" or not (num.isdigit() and len(num) <= 2 and int(num) <= 23):
+            continue
+        j = i + 2
+        if j < len(tokens) and tokens[j][2].rstrip(",.;!?»)") in HOUR_UNITS:
+            return i, j + 1
+        if j == len(tokens) or loose:
+            return i, j
+    return None
+
+
+def _scan(text: str, loose: bool = False) -> _Scan:
+    """
+    Один проход автоматом по тексту: голоса интентов, маркеры дня,
+    временные блоки и токены будущего названия (без стоп-слов).
+    loose — голый час в любом месте фразы (остаток после повторения).
+    """
+    low = text.lower()
+    out = _Scan()
+    tokens: List[Tuple[int, int, str, bool]] = []  # (start, end, текст, стоп-слово?)
+    state = 0
+    tok_start = -1
+    stop_end = -1
+    n = len(low)
+    for i in range(n + 1):
+        ch = low[i] if i < n else " "
+        if ch.isspace():
+            if tok_start >= 0:
+                tokens.append((tok_start, i, low[tok_start:i], stop_end == i - 1))
+                tok_start = -1
+        elif tok_start < 0:
+            tok_start = i
+        if i == n:
+            break
+        state = _AUTOMATON.step(state, ch)
+        for length, (kind, value) in _AUTOMATON.outputs(state):
+            if kind == "stop":
+                if i - length + 1 == tok_start:
+                    stop_end = i
+            elif kind == "intent":
+                out.votes[value] += 1
+            else:
+                out.marks.add(value)
+
+    blocks: List[Tuple[int, int]] = []
+    i = 0
+    while i < len(tokens):
+        block = _time_block_len(tokens, i)
+        if block:
+            blocks.append((i, i + block))
+        i += block or 1
+    if not blocks:
+        bare = _bare_hour_block(tokens, loose)
+        if bare:
+            blocks.append(bare)
+
+    in_block = set()
+    for i, j in blocks:
+        out.time_spans.append((tokens[i][0], tokens[j - 1][1]))
+        in_block.update(range(i, j))
+    for i, (_start, _end, tok, is_stop) in enumerate(tokens):
+        if i in in_block or is_stop:
+            continue
+        word = "".join(c for c in tok if c.isalnum() or c in "_-")
+        if word:
+            out.title_tokens.append(word)
+    return out
+
+
+def _clean_title(text: str, scan: Optional[_Scan] = None) -> str:
+    # временные блоки и стоп-слова уже отсеяны сканером
+    scan = scan or _scan(text)
+    s = " ".join(scan.title_tokens)
 
     # если всё вырезали — вернём исходник, но без краевых пробелов
     return s or text.strip()
@@ -147,15 +447,15 @@ def _choose_best_match(matches, now: datetime) -> Optional[datetime]:
 
 
 
-def _parse_when(text: str, tz: str) -> Optional[datetime]:
+def _parse_when(text: str, tz: str, now: Optional[datetime] = None, loose: bool = False) -> Optional[datetime]:
     """
     Ищем дату/время в строке устойчиво:
-    - нормализуем «15.15 / 15 15 / 1515»
+    - нормализуем «15.15 / 15 15 / 1515 / в 9 утра»
     - search_dates достаёт дату из «шума»
     - предпочитаем ближайшее будущее
     """
-    normalized = _normalize_time_tokens(text)
-    now = datetime.now()
+    normalized = _normalize_time_tokens(text, loose)
+    now = now or datetime.now()
 
     settings = {
         "PREFER_DATES_FROM": "future",
@@ -179,40 +479,308 @@ def _parse_when(text: str, tz: str) -> Optional[datetime]:
 
 # ---------- основной парсер ----------
 
-def parse_intent(text: str, tz: str = "Asia/Yekaterinburg") -> Intent:
-    """
-    Простой NLU:
-    - пытается создать событие (вытаскивает when + title)
-    - 'list' / 'move' / 'delete' — упрощённые заглушки
-    """
-    t = text.strip()
-
-    # 1) create
-    when = _parse_when(t, tz)
-    if when:
-        title = _clean_title(t)
-        end = when + timedelta(minutes=30)
-        return Intent(type="create", title=title, start=when, end=end)
-
-    # 2) list (очень грубо)
+# Якорь — как восстановить datetime-поле разбора в другой момент времени:
+#   ("now", delta)             — now + delta («через 10 минут»)
+#   ("day", delta)             — полночь сегодня + delta («завтра в 10»)
+#   ("clock", delta)           — ближайшее будущее время суток delta («в 15:00»: сегодня или завтра)
+#   ("weekday", wd, delta)     — полночь ближайшего дня недели wd + delta («в пятницу в 14»)
+#   ("abs", dt)                — как есть («25 декабря в 20:00»)
+#   ("rrule", clock)           — первое вхождение серии с временем clock
+#   ("rel", field, delta)      — другое поле + delta (end = start + 30 мин)
+Anchor = tuple
+
+
+def _midnight(dt: datetime) -> datetime:
+    return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+_DAY_MARKS = {"сегодня", "завтра", "послезавтра", "через"}
+# на сколько дней от сегодня указывает маркер («послезавтра» содержит «завтра» — проверяем первым)
+_DAY_OFFSETS = (("послезавтра", 2), ("завтра", 1), ("сегодня", 0))
+
+
+def _next_clock(now: datetime, clock: timedelta) -> datetime:
+    """Ближайшее (не раньше now) время суток clock — так «в 15:00» понимает dateparser."""
+    at = _midnight(now) + clock
+    return at if at > now else at + timedelta(days=1)
+
+
+def _only_clock(text: str, scan: _Scan) -> bool:
+    """В тексте из времени — только часы («в 15:00 …»), без даты цифрами."""
+    rest = list(text)
+    for start, end in scan.time_spans:
+        rest[start:end] = " " * (end - start)
+    # «2026-12-25», «25.12» — дата цифрами, днём относительно now она не является
+    return scan.time_spans != [] and not any(ch.isdigit() for ch in rest)
+
+
+def _create_anchor(scan: _Scan, text: str, when: datetime, now: datetime) -> Optional[Anchor]:
+    marks = scan.marks
+    if "через" in marks and not scan.time_spans:
+        return ("now", when - now)
+    if "weekday" in marks and not marks & _DAY_MARKS:
+        return ("weekday", when.weekday(), when - _midnight(when))
+    if "month" in marks and not marks & (_DAY_MARKS | {"weekday"}):
+        return ("abs", when)
+    if marks & _DAY_MARKS:
+        for mark, days in _DAY_OFFSETS:
+            if mark in marks and (when.date() - now.date()).days != days:
+                # dateparser не заметил «завтра» (или оно про другое) — от дня не отсчитать
+                return None
+        return ("day", when - _midnight(now))
+    if _only_clock(text, scan):
+        clock = when - _midnight(when)
+        # «в 15:00» в 16:00 — это завтра; якорь «день + N» сдвинул бы его ещё на сутки
+        return ("clock", clock) if when == _next_clock(now, clock) else None
+    # непонятно, от чего отсчитана дата, — не кэшируем
+    return None
+
+
+def _parse_uncached(t: str, tz: str, now: datetime) -> Tuple[Intent, Optional[Dict[str, Anchor]]]:
+    """Разбор + якоря полей для кэша (None — результат кэшировать нельзя)."""
     low = t.lower()
-    if any(kw in low for kw in ["что у меня", "расписан", "покажи план"]):
-        start = datetime.now()
+    scan = _scan(t)
+    today = _midnight(now)
+
+    # 0) поиск свободного окна — раньше create, иначе «завтра» уйдёт в дату события
+    if scan.votes["free"]:
+        if "сегодня" in scan.marks:
+            start = now
+            end = today + timedelta(days=1)
+            anchors = {"range_start": ("now", timedelta(0)), "range_end": ("day", timedelta(days=1))}
+        elif "завтра" in scan.marks:
+            # «послезавтра» содержит «завтра»
+            days = 2 if "послезавтра" in scan.marks else 1
+            start = today + timedelta(days=days)
+            end = start + timedelta(days=1)
+            anchors = {"range_start": ("day", timedelta(days=days)), "range_end": ("day", timedelta(days=days + 1))}
+        else:
+            start = now
+            end = now + timedelta(days=7)
+            anchors = {"range_start": ("now", timedelta(0)), "range_end": ("now", timedelta(days=7))}
+        duration = _parse_duration(low) or DEFAULT_FREE_DURATION
+        return Intent(type="free", range_start=start, range_end=end, duration=duration), anchors
+
+    # 1) «что у меня сегодня/завтра» — раньше create: иначе «завтра» станет датой события
+    if scan.votes["list"]:
+        if "сегодня" in scan.marks:
+            start, anchor = today, ("day", timedelta(0))
+        elif "завтра" in scan.marks:
+            days = 2 if "послезавтра" in scan.marks else 1
+            start, anchor = today + timedelta(days=days), ("day", timedelta(days=days))
+        else:
+            start, anchor = now, ("now", timedelta(0))
         end = start + timedelta(days=1)
-        return Intent(type="list", range_start=start, range_end=end)
-    if "сегодня" in low:
-        start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        anchors = {"range_start": anchor, "range_end": ("rel", "range_start", timedelta(days=1))}
+        return Intent(type="list", range_start=start, range_end=end), anchors
+
+    # 2) перенос / удаление — раньше create: «перенеси планёрку на завтра в 10» — не новое событие
+    if scan.votes["move"]:
+        selector = _selector(scan)
+        new_start = _parse_when(t, tz, now)
+        if new_start is None:
+            return Intent(type="move", selector=selector), None
+        anchor = _create_anchor(scan, t, new_start, now)
+        anchors = {"new_start": anchor} if anchor is not None else None
+        return Intent(type="move", selector=selector, new_start=new_start), anchors
+    if scan.votes["delete"]:
+        series = any(w in WHOLE_SERIES_WORDS for w in scan.title_tokens)
+        return Intent(type="delete", selector=_selector(scan), series=series), {}
+
+    # 3) повторяющееся событие: время берём из остатка, первое вхождение считает RRULE
+    recurrence = _parse_recurrence(t) if scan.votes["recur"] else None
+    if recurrence:
+        rule, rest = recurrence
+        when = _parse_when(rest, tz, now, loose=True)
+        if when:
+            dtstart = datetime.combine(now.date(), when.time())
+            first = next_occurrence(rule, dtstart, now + timedelta(seconds=60))
+            if first:
+                intent = Intent(
+                    type="create",
+                    title=_clean_title(rest, _scan(rest, loose=True)),
+                    start=first,
+                    end=first + timedelta(minutes=30),
+                    recurrence=rule,
+                )
+                anchors = {"start": ("rrule", when.time()), "end": ("rel", "start", timedelta(minutes=30))}
+                return intent, anchors
+
+    # 4) create
+    when = _parse_when(t, tz, now)
+    if when:
+        title = _clean_title(t, scan)
+        end = when + timedelta(minutes=30)
+        start_anchor = _create_anchor(scan, t, when, now)
+        if start_anchor is None:
+            return Intent(type="create", title=title, start=when, end=end), None
+        anchors = {"start": start_anchor, "end": ("rel", "start", timedelta(minutes=30))}
+        return Intent(type="create", title=title, start=when, end=end), anchors
+
+    # 5) list (очень грубо)
+    if "сегодня" in scan.marks:
+        start = today
         end = start + timedelta(days=1)
-        return Intent(type="list", range_start=start, range_end=end)
-    if "завтра" in low:
-        start = (datetime.now() + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        anchors = {"range_start": ("day", timedelta(0)), "range_end": ("day", timedelta(days=1))}
+        return Intent(type="list", range_start=start, range_end=end), anchors
+    if "завтра" in scan.marks:
+        start = today + timedelta(days=1)
         end = start + timedelta(days=1)
-        return Intent(type="list", range_start=start, range_end=end)
+        anchors = {"range_start": ("day", timedelta(days=1)), "range_end": ("day", timedelta(days=2))}
+        return Intent(type="list", range_start=start, range_end=end), anchors
+
+    # «не понял» не кэшируем: фразы вроде «в 15:00 …» после 15:00 сюда попадают временно
+    return Intent(type="unknown"), None
 
-    # 3) move / delete — заглушки (чтобы не ломать main.py)
-    if any(kw in low for kw in ["перенеси", "перенос"]):
-        return Intent(type="move", selector=t)
-    if any(kw in low for kw in ["удали", "отмени"]):
-        return Intent(type="delete", selector=t)
 
-    return Intent(type="unknown")
+def might_read(text: str) -> bool:
+    """
+    Дешёвая проверка по ключевым словам (без разбора дат): может ли фраза
+    оказаться list/free. Отсекает гипотезы, которые спекулятивно разбирать незачем.
+    """
+    votes = _scan(text).votes
+    return bool(votes["list"] or votes["free"])
+
+
+# ---------- кэш разборов ----------
+
+NLU_CACHE_SIZE = int(os.getenv("NLU_CACHE_SIZE", "1024"))
+
+_cache: "OrderedDict[Tuple[str, str], Tuple[Intent, Dict[str, Anchor]]]" = OrderedDict()
+_cache_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "uncacheable": 0, "miss_time": 0.0, "hit_time": 0.0}
+
+
+def _resolve(anchors: Dict[str, Anchor], rule: Optional[str], now: datetime) -> Optional[Dict[str, datetime]]:
+    """Якоря → конкретные datetime для момента now (None — якорь здесь неприменим)."""
+    today = _midnight(now)
+    out: Dict[str, datetime] = {}
+    for name, anchor in anchors.items():
+        kind = anchor[0]
+        if kind == "now":
+            out[name] = now + anchor[1]
+        elif kind == "day":
+            out[name] = today + anchor[1]
+        elif kind == "clock":
+            out[name] = _next_clock(now, anchor[1])
+        elif kind == "weekday":
+            days = (anchor[1] - today.weekday()) % 7
+            if days == 0:
+                # «в пятницу» в саму пятницу — неоднозначно, пусть решает dateparser
+                return None
+            out[name] = today + timedelta(days=days) + anchor[2]
+        elif kind == "abs":
+            out[name] = anchor[1]
+        elif kind == "rrule":
+            occ = next_occurrence(rule, datetime.combine(now.date(), anchor[1]), now + timedelta(seconds=60))
+            if occ is None:
+                return None
+            out[name] = occ
+    for name, anchor in anchors.items():
+        if anchor[0] == "rel":
+            out[name] = out[anchor[1]] + anchor[2]
+    return out
+
+
+def _thaw(frozen: Intent, anchors: Dict[str, Anchor], now: datetime) -> Optional[Intent]:
+    values = _resolve(anchors, frozen.recurrence, now)
+    if values is None:
+        return None
+    # дата события должна оставаться в будущем — как требует _parse_when
+    if frozen.type == "create" and values["start"] <= now + timedelta(seconds=60):
+        return None
+    return replace(frozen, **values)
+
+
+# момент для второй самопроверки: другие сутки и другое время дня
+_PROBE_SHIFT = timedelta(days=1, hours=7)
+
+
+def _freeze(
+    intent: Intent, anchors: Dict[str, Anchor], now: datetime, reparse: Callable[[datetime], Intent]
+) -> Optional[Intent]:
+    """
+    Отвязать разбор от now. Самопроверка: восстановление в тот же now даёт то же самое,
+    а в сдвинутый (now + _PROBE_SHIFT) — то же, что честный разбор reparse(там).
+    Вторая проверка ловит неверный якорь (dateparser выбрал завтра, пропустил «завтра»…)
+    ценой второго разбора на промахе; не сошлось — не кэшируем.
+    """
+    if _thaw(replace(intent), anchors, now) != intent:
+        return None
+    frozen = replace(intent, **{name: None for name in anchors})
+    later = now + _PROBE_SHIFT
+    thawed = _thaw(frozen, anchors, later)
+    if thawed is not None and thawed != reparse(later):
+        return None
+    return frozen
+
+
+def parse_intent(
+    text: str, tz: str = "Asia/Yekaterinburg", now: Optional[datetime] = None, cache: bool = True
+) -> Intent:
+    """
+    Простой NLU:
+    - пытается создать событие (вытаскивает when + title)
+    - повторения («каждый понедельник в 9 …») → create с RRULE
+    - 'list' — что запланировано; 'move' / 'delete' — по словам названия (+ новое время / вся серия)
+    - 'free' — поиск свободного окна заданной длины
+
+    now — момент, относительно которого считать «через 10 минут» (по умолчанию — сейчас).
+    Результаты кэшируются (LRU) в виде, не зависящем от времени, и при попадании
+    заново привязываются к now. cache=False — разбор мимо кэша (промежуточные
+    гипотезы распознавания: повторно не встретятся, а вытеснили бы нужные записи).
+    """
+    t = text.strip()
+    now = now or datetime.now()
+    if not cache:
+        return _parse_uncached(t, tz, now)[0]
+    key = (t, tz)
+    started = _time.perf_counter()
+
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None:
+            _cache.move_to_end(key)
+    if entry is not None:
+        intent = _thaw(entry[0], entry[1], now)
+        if intent is not None:
+            with _cache_lock:
+                _stats["hits"] += 1
+                _stats["hit_time"] += _time.perf_counter() - started
+            return intent
+
+    intent, anchors = _parse_uncached(t, tz, now)
+    frozen = None
+    if anchors is not None:
+        frozen = _freeze(intent, anchors, now, lambda later: _parse_uncached(t, tz, later)[0])
+    with _cache_lock:
+        _stats["misses"] += 1
+        _stats["miss_time"] += _time.perf_counter() - started
+        if frozen is None:
+            _stats["uncacheable"] += 1
+        else:
+            _cache[key] = (frozen, anchors)
+            _cache.move_to_end(key)
+            while len(_cache) > NLU_CACHE_SIZE:
+                _cache.popitem(last=False)
+    return intent
+
+
+def parse_cache_stats() -> Dict[str, float]:
+    """Попадания, промахи и оценка сэкономленного времени (сек)."""
+    with _cache_lock:
+        st = dict(_stats)
+        size = len(_cache)
+    total = st["hits"] + st["misses"]
+    avg_miss = st["miss_time"] / st["misses"] if st["misses"] else 0.0
+    avg_hit = st["hit_time"] / st["hits"] if st["hits"] else 0.0
+    return {
+        "size": size,
+        "hits": st["hits"],
+        "misses": st["misses"],
+        "uncacheable": st["uncacheable"],
+        "hit_rate": st["hits"] / total if total else 0.0,
+        "avg_miss_ms": avg_miss * 1000,
+        "avg_hit_ms": avg_hit * 1000,
+        "saved_sec": st["hits"] * max(avg_miss - avg_hit, 0.0),
+    }
@@ -1,18 +1,38 @@
 from fastapi import FastAPI, Request
-from fastapi.responses import PlainTextResponse
+from fastapi.responses import PlainTextResponse, RedirectResponse
 from google_auth_oauthlib.flow import Flow
 from dotenv import load_dotenv   # <<< добавить импорт
-import os, json
+import os, json, re
+
+from app.tenants import ROOT_DIR, LinkNotConfigured, token_path, verify_link
 
 load_dotenv()  # <<< ВАЖНО: подгружаем .env
 
 os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1"   # DEV-режим: разрешить http://localhost
 
+# многопользовательский режим: state OAuth → user_id, по файлу на незавершённую привязку
+STATES_DIR = ROOT_DIR / "state" / "oauth_states"
+
 
 app = FastAPI()
 
 @app.get("/oauth/google")
-async def start_google():
+async def start_google(user: int | None = None, exp: int | None = None, sig: str | None = None):
+    """
+    Без параметров — токен владельца (google_token.json).
+    ?user=<telegram id>&exp=<срок>&sig=<подпись> — ссылка из /link: токен этого пользователя.
+    """
+    if user is not None:
+        try:
+            valid = bool(exp and sig) and verify_link(user, exp, sig)
+        except LinkNotConfigured:
+            return PlainTextResponse("Привязка аккаунтов не настроена: задайте LINK_SECRET.", status_code=503)
+        if not valid:
+            return PlainTextResponse(
+                "Ссылка привязки недействительна или устарела. Запросите новую командой /link.",
+                status_code=403,
+            )
+
     flow = Flow.from_client_secrets_file(
         "client_secret.json",
         scopes=["https://www.googleapis.com/auth/calendar"],
@@ -23,15 +43,28 @@ async def start_google():
         include_granted_scopes="true",
         prompt="consent",
     )
-    with open(".oauth_state", "w") as f:
-        f.write(state)
-    return PlainTextResponse(auth_url)
+    if user is None:
+        with open(".oauth_state", "w") as f:
+            f.write(state)
+        return PlainTextResponse(auth_url)
+
+    STATES_DIR.mkdir(parents=True, exist_ok=True)
+    (STATES_DIR / state).write_text(str(user))
+    return RedirectResponse(auth_url)
 
 
 @app.get("/oauth/google/callback")
 async def google_callback(request: Request):
-    with open(".oauth_state") as f:
-        state = f.read()
+    state = request.query_params.get("state", "")
+    pending = STATES_DIR / state if re.fullmatch(r"[\w-]+", state) else None
+    user = None
+    if pending is not None and pending.exists():
+        user = int(pending.read_text())
+        pending.unlink()
+    else:
+        with open(".oauth_state") as f:
+            state = f.read()
+
     flow = Flow.from_client_secrets_file(
         "client_secret.json",
         scopes=["https://www.googleapis.com/auth/calendar"],
@@ -40,6 +73,12 @@ async def google_callback(request: Request):
     )
     flow.fetch_token(authorization_response=str(request.url))
     creds = flow.credentials
-    with open("google_token.json", "w") as f:
-        f.write(creds.to_json())
-    return PlainTextResponse("Google OAuth OK. Token сохранён.")
+    if user is None:
+        with open("google_token.json", "w") as f:
+            f.write(creds.to_json())
+        return PlainTextResponse("Google OAuth OK. Token сохранён.")
+
+    path = token_path(user)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(creds.to_json())
+    return PlainTextResponse("Google-календарь привязан. Можно возвращаться в Telegram.")
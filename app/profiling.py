@@ -0,0 +1,164 @@
+# app/profiling.py
+"""
+Профилирование «на живую», без передеплоя:
+  - семплирующий профайлер → файл в формате collapsed stacks
+    (понимают flamegraph.pl, speedscope, inferno);
+  - снимки tracemalloc и разница между двумя снимками;
+  - сторож event loop: если цикл заблокирован дольше порога,
+    в лог пишется стек того, что его держит.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import tracemalloc
+import traceback
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{Path(code.co_filename).name}:{code.co_name}:{frame.f_lineno}"
+
+
+# ---------- CPU ----------
+class SamplingProfiler:
+    """Раз в interval секунд снимает стеки всех потоков (кроме своего)."""
+
+    def __init__(self, out_dir: str = "./tmp_prof", interval: float = 0.005):
+        self.out_dir = Path(out_dir)
+        self.interval = interval
+        self._lock = threading.Lock()
+
+    def _sample(self, seconds: float) -> Counter:
+        stacks: Counter = Counter()
+        me = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                parts = []
+                while frame is not None:
+                    parts.append(_frame_label(frame))
+                    frame = frame.f_back
+                parts.append(names.get(ident, str(ident)))
+                stacks[";".join(reversed(parts))] += 1
+            time.sleep(self.interval)
+        return stacks
+
+    async def run(self, seconds: float) -> Path:
+        """Профилировать seconds секунд и вернуть путь к .folded файлу."""
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("профайлер уже запущен")
+        try:
+            stacks = await asyncio.to_thread(self._sample, seconds)
+        finally:
+            self._lock.release()
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        path = self.out_dir / f"cpu-{datetime.now().strftime('%Y%m%d-%H%M%S')}.folded"
+        with open(path, "w") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        logger.info("[PROF] CPU: %d семплов → %s", sum(stacks.values()), path)
+        return path
+
+
+# ---------- память ----------
+class MemoryTracker:
+    """Снимки tracemalloc; каждый следующий сравнивается с предыдущим."""
+
+    def __init__(self, frames: int = 10):
+        self.frames = frames
+        self._last: Optional[tracemalloc.Snapshot] = None
+
+    def snapshot(self, top: int = 15) -> str:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._last = tracemalloc.take_snapshot()
+            return "tracemalloc включён, первый снимок сделан. Повторите команду позже — пришлю разницу."
+        snap = tracemalloc.take_snapshot()
+        prev, self._last = self._last, snap
+        current, peak = tracemalloc.get_traced_memory()
+        head = f"Сейчас: {current / 1e6:.1f} МБ, пик: {peak / 1e6:.1f} МБ"
+        if prev is None:
+            return head
+        lines = [head, "Рост с прошлого снимка:"]
+        for stat in snap.compare_to(prev, "lineno")[:top]:
+            lines.append(str(stat))
+        return "\n".join(lines)
+
+    def stop(self) -> None:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self._last = None
+
+
+# ---------- сторож event loop ----------
+class LoopWatchdog:
+    """
+    Корутина-«пульс» обновляет метку времени каждые threshold/4 секунд.
+    Отдельный поток следит за меткой: если пульса нет дольше threshold —
+    значит, цикл занят синхронным кодом, и его стек уходит в лог.
+    """
+
+    def __init__(self, threshold: float = 0.5):
+        self.threshold = threshold
+        self._beat = time.monotonic()
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        logger.info("[PROF] сторож event loop включён, порог %.0f мс", self.threshold * 1000)
+
+    def stop(self) -> None:
+        if not self.running:
+            return
+        self._stop.set()
+        self._task.cancel()
+        self._task = None
+        self._thread = None
+        logger.info("[PROF] сторож event loop выключен")
+
+    async def _heartbeat(self) -> None:
+        while True:
+            self._beat = time.monotonic()
+            await asyncio.sleep(self.threshold / 4)
+
+    def _watch(self) -> None:
+        reported = False
+        while not self._stop.wait(self.threshold / 4):
+            lag = time.monotonic() - self._beat
+            if lag < self.threshold:
+                reported = False
+                continue
+            if reported:
+                continue
+            # один отчёт на одну блокировку
+            reported = True
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "(стек недоступен)"
+            logger.warning("[PROF] event loop заблокирован %.0f мс:\n%s", lag * 1000, stack)
@@ -0,0 +1,56 @@
+# app/recurrence.py
+"""
+Повторяющиеся события: правила RRULE (RFC 5545) и ленивое развёртывание.
+Вхождения серии никогда не материализуются списком — считается только
+следующее после заданного момента.
+"""
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Dict, Iterator, Optional
+
+from dateutil.rrule import rrulestr
+
+WEEKDAY_CODES = ["MO", "TU", "WE", "TH", "FR", "SA", "SU"]
+
+# «по понедельникам», «по средам» … — для человекочитаемого описания
+_WD_DATIVE = {
+    "MO": "понедельникам", "TU": "вторникам", "WE": "средам", "TH": "четвергам",
+    "FR": "пятницам", "SA": "субботам", "SU": "воскресеньям",
+}
+
+
+def _parts(rule: str) -> Dict[str, str]:
+    body = rule.split(":", 1)[1] if rule.upper().startswith("RRULE:") else rule
+    return dict(p.split("=", 1) for p in body.split(";") if "=" in p)
+
+
+def next_occurrence(rule: str, dtstart: datetime, after: datetime) -> Optional[datetime]:
+    """Первое вхождение серии строго после after (None — серия закончилась)."""
+    return rrulestr(rule, dtstart=dtstart).after(after)
+
+
+def iter_occurrences(rule: str, dtstart: datetime, until: datetime) -> Iterator[datetime]:
+    """Вхождения серии до until (не включая) — лениво, по одному."""
+    for occ in rrulestr(rule, dtstart=dtstart):
+        if occ >= until:
+            return
+        yield occ
+
+
+def describe(rule: str) -> str:
+    """RRULE → «каждый день» / «по будням» / «по понедельникам, средам» …"""
+    p = _parts(rule)
+    freq = p.get("FREQ", "")
+    days = [d for d in p.get("BYDAY", "").split(",") if d]
+    if freq == "DAILY":
+        return "каждый день"
+    if freq == "WEEKLY":
+        if days == WEEKDAY_CODES[:5]:
+            return "по будням"
+        if days:
+            return "по " + ", ".join(_WD_DATIVE[d] for d in days if d in _WD_DATIVE)
+        return "каждую неделю"
+    if freq == "MONTHLY":
+        return "каждый месяц"
+    return "регулярно"
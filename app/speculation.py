@@ -0,0 +1,117 @@
+# app/speculation.py
+"""
+Спекулятивный разбор голосового, пока Vosk ещё декодирует:
+по промежуточным гипотезам (PartialResult) разбираем намерение и, если оно
+только читает календарь (list/free), заранее запускаем запрос.
+Итоговая расшифровка разбирается заново: совпало намерение — берём готовый
+(или ещё летящий) результат, нет — отменяем и выбрасываем.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from app.nlu import Intent, might_read
+
+logger = logging.getLogger(__name__)
+
+# только намерения без побочных эффектов: их можно выполнить «зря»
+SPECULATIVE_TYPES = ("list", "free")
+
+_stats: Counter = Counter()
+_stats_lock = threading.Lock()
+
+
+def _intent_key(intent: Intent) -> Tuple:
+    # то, от чего зависит результат запроса (заголовок и пр. — не важны)
+    return intent.type, intent.range_start, intent.range_end, intent.duration
+
+
+def _bump(name: str) -> None:
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def speculation_stats() -> Dict[str, float]:
+    with _stats_lock:
+        st = dict(_stats)
+    started = st.get("started", 0)
+    st.setdefault("committed", 0)
+    st.setdefault("discarded", 0)
+    st["hit_rate"] = st["committed"] / started if started else 0.0
+    st["started"] = started
+    return st
+
+
+class Speculation:
+    """
+    Одна голосовая реплика. feed() и commit() вызываются из event loop
+    (из потока распознавания — через loop.call_soon_threadsafe).
+    parse(text, cache=...) — разбор; гипотезы разбираются мимо кэша.
+    """
+
+    def __init__(
+        self,
+        parse: Callable[..., Intent],
+        prefetch: Callable[[Intent], Awaitable[Any]],
+    ):
+        self._parse = parse
+        self._prefetch = prefetch
+        self._text = ""
+        self._key: Optional[Tuple] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def feed(self, partial: str) -> None:
+        """Очередная промежуточная гипотеза распознавателя."""
+        partial = partial.strip()
+        if not partial or partial == self._text:
+            return
+        self._text = partial
+        # полный разбор (~10 мс, в event loop) — только если по ключевым словам это чтение
+        if not might_read(partial):
+            return
+        try:
+            intent = self._parse(partial, cache=False)
+        except Exception as e:
+            logger.debug("[SPEC] не разобрал %r: %s", partial, e)
+            return
+        if intent.type not in SPECULATIVE_TYPES:
+            return
+        key = _intent_key(intent)
+        if key == self._key:
+            return
+        # гипотеза изменила смысл — старый запрос больше не нужен
+        self.cancel()
+        self._key = key
+        self._task = asyncio.ensure_future(self._prefetch(intent))
+        _bump("started")
+        logger.info("[SPEC] %s по гипотезе %r", intent.type, partial)
+
+    def commit(self, text: str) -> Tuple[Intent, Optional[asyncio.Task]]:
+        """
+        Разобрать итоговый текст. Вернуть намерение и задачу с заранее
+        запрошенным результатом — только если намерение совпало.
+        """
+        intent = self._parse(text)
+        if self._task is not None and _intent_key(intent) == self._key:
+            task, self._task = self._task, None
+            _bump("committed")
+            return intent, task
+        self.cancel()
+        return intent, None
+
+    def cancel(self) -> None:
+        """Отменить предзапрос (распознавание не удалось и т.п.)."""
+        task, self._task = self._task, None
+        self._key = None
+        if task is None:
+            return
+        _bump("discarded")
+        if not task.done():
+            task.cancel()
+        elif not task.cancelled() and task.exception() is not None:
+            # ошибка «лишнего» запроса никому не нужна, но забрать её надо
+            logger.debug("[SPEC] отброшенный запрос упал: %s", task.exception())
@@ -17,6 +17,20 @@ class Storage:
             created TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
         """)
+        # повторяющиеся серии: одна строка на серию, вхождения считаются лениво
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS series (
+            event_id TEXT PRIMARY KEY,
+            summary TEXT,
+            rrule TEXT,
+            dtstart TEXT,
+            user_id INTEGER DEFAULT 0
+        )
+        """)
+        # базы до многопользовательского режима: серии без владельца (user_id = 0)
+        columns = [row[1] for row in cur.execute("PRAGMA table_info(series)")]
+        if "user_id" not in columns:
+            cur.execute("ALTER TABLE series ADD COLUMN user_id INTEGER DEFAULT 0")
         self.conn.commit()
 
     def add_note(self, text: str):
@@ -28,3 +42,21 @@ class Storage:
         cur = self.conn.cursor()
         cur.execute("SELECT text FROM notes ORDER BY created DESC LIMIT 20")
         return [row[0] for row in cur.fetchall()]
+
+    def add_series(self, event_id: str, summary: str, rrule: str, dtstart: str, user_id: int = 0):
+        cur = self.conn.cursor()
+        cur.execute(
+            "INSERT OR REPLACE INTO series (event_id, summary, rrule, dtstart, user_id) VALUES (?, ?, ?, ?, ?)",
+            (event_id, summary, rrule, dtstart, user_id),
+        )
+        self.conn.commit()
+
+    def delete_series(self, event_id: str):
+        cur = self.conn.cursor()
+        cur.execute("DELETE FROM series WHERE event_id = ?", (event_id,))
+        self.conn.commit()
+
+    def list_series(self) -> list[tuple[str, str, str, str, int]]:
+        cur = self.conn.cursor()
+        cur.execute("SELECT event_id, summary, rrule, dtstart, user_id FROM series")
+        return cur.fetchall()
@@ -1,44 +1,76 @@
 # app/stt.py
 import subprocess
 import os
+import logging
+import threading
 from vosk import Model, KaldiRecognizer
-import wave
 import json
+from typing import Callable
 
+from app.audio import decode_to_pcm
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
 _model = None
+_model_lock = threading.Lock()
 
 
 def _ensure_model(path: str):
     global _model
     if _model is None:
-        _model = Model(path)
+        # догоняющий режим распознаёт в нескольких потоках сразу после старта:
+        # без блокировки каждый загрузил бы свою копию модели
+        with _model_lock:
+            if _model is None:
+                _model = Model(path)
 
 
-def _ogg_to_wav(in_path: str, out_path: str):
-    subprocess.run(
-        ["ffmpeg", "-y", "-i", in_path, "-ar", "16000", "-ac", "1", out_path],
-        check=True
+def _ogg_to_pcm_ffmpeg(in_path: str) -> bytes:
+    # запасной путь: внешний ffmpeg, PCM сразу в stdout (без промежуточного wav)
+    proc = subprocess.run(
+        ["ffmpeg", "-loglevel", "error", "-i", in_path,
+         "-f", "s16le", "-ar", str(SAMPLE_RATE), "-ac", "1", "-"],
+        check=True,
+        stdout=subprocess.PIPE,
     )
+    return proc.stdout
+
 
+def _ogg_to_pcm(in_path: str) -> bytes:
+    """OGG/Opus → PCM s16le mono 16 кГц: в процессе через PyAV, при сбое — ffmpeg."""
+    try:
+        return decode_to_pcm(in_path, SAMPLE_RATE)
+    except Exception as e:
+        logger.warning("[STT] PyAV не справился (%s) — использую ffmpeg", e)
+        return _ogg_to_pcm_ffmpeg(in_path)
 
-def transcribe_voice(ogg_path: str, model_path: str | None = None) -> str:
+
+def transcribe_voice(
+    ogg_path: str,
+    model_path: str | None = None,
+    on_partial: Callable[[str], None] | None = None,
+) -> str:
+    """
+    on_partial — вызывается по ходу декодирования с текущей гипотезой
+    (уже завершённые фразы + PartialResult текущей), из того же потока.
+    """
     mp = model_path or os.getenv("VOSK_MODEL_PATH", "/models/vosk-ru")
     _ensure_model(mp)
 
-    wav_path = ogg_path.replace(".ogg", ".wav")
-    _ogg_to_wav(ogg_path, wav_path)
-
-    wf = wave.open(wav_path, "rb")
-    rec = KaldiRecognizer(_model, wf.getframerate())
+    pcm = _ogg_to_pcm(ogg_path)
+    rec = KaldiRecognizer(_model, SAMPLE_RATE)
 
     text = []
-    while True:
-        data = wf.readframes(4000)
-        if len(data) == 0:
-            break
-        if rec.AcceptWaveform(data):
+    chunk = 4000 * 2  # 4000 семплов s16
+    for pos in range(0, len(pcm), chunk):
+        if rec.AcceptWaveform(pcm[pos:pos + chunk]):
             j = json.loads(rec.Result())
             text.append(j.get("text", ""))
+        elif on_partial is not None:
+            partial = json.loads(rec.PartialResult()).get("partial", "")
+            if partial:
+                on_partial(" ".join(t for t in text + [partial] if t))
 
     j = json.loads(rec.FinalResult())
     text.append(j.get("text", ""))
@@ -0,0 +1,270 @@
+# app/tenants.py
+"""
+Многопользовательский режим: у каждого пользователя Telegram — свой токен Google,
+свой клиент календаря, индекс занятости, сводка дня и своя очередь запросов.
+
+  - токены: TOKENS_DIR/<user_id>.json (их пишет app/oauth_server.py по подписанной ссылке);
+  - клиенты строятся лениво и живут в LRU-кэше на TENANT_CACHE_SIZE пользователей —
+    память ограничена независимо от числа привязанных аккаунтов;
+  - запросы пользователя выполняются строго по очереди (своим воркером),
+    а все воркеры делят общий семафор: тяжёлый пользователь занимает не больше
+    одного слота и не может вытеснить остальных.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import hmac
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import timedelta
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.calendar_client import CalendarClient
+from app.digest import AgendaDigest
+from app.freebusy import FreeBusyIndex
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+
+
+# ---------- привязка аккаунта ----------
+# TOKENS_DIR, LINK_SECRET и LINK_TTL_SECONDS читаем при вызове: модуль импортируется
+# и bot, и oauth_server, раньше, чем load_dotenv()
+def tokens_dir() -> Path:
+    return Path(os.getenv("TOKENS_DIR", ROOT_DIR / "state" / "tokens"))
+
+
+class LinkNotConfigured(RuntimeError):
+    """LINK_SECRET не задан — подписанные ссылки привязки недоступны."""
+
+
+def link_configured() -> bool:
+    return bool(os.getenv("LINK_SECRET"))
+
+
+def link_signature(user_id: int, expires: int) -> str:
+    """
+    Подпись ссылки привязки: чужой токен к своему id не подставить, а утёкшая
+    ссылка годится только до expires (unix-время, входит в подпись).
+    """
+    secret = os.getenv("LINK_SECRET", "")
+    if not secret:
+        raise LinkNotConfigured("LINK_SECRET не задан — подписанные ссылки привязки недоступны")
+    msg = f"{user_id}:{expires}".encode()
+    return hmac.new(secret.encode(), msg, hashlib.sha256).hexdigest()[:32]
+
+
+def link_query(user_id: int) -> str:
+    """Параметры ссылки /link: user, exp и sig."""
+    expires = int(time.time()) + int(os.getenv("LINK_TTL_SECONDS", "900"))
+    return f"user={user_id}&exp={expires}&sig={link_signature(user_id, expires)}"
+
+
+def verify_link(user_id: int, expires: int, sig: str) -> bool:
+    if expires < time.time():
+        return False
+    return hmac.compare_digest(link_signature(user_id, expires), sig)
+
+
+def token_path(user_id: int) -> Path:
+    return tokens_dir() / f"{user_id}.json"
+
+
+def linked_users() -> List[int]:
+    root = tokens_dir()
+    if not root.exists():
+        return []
+    return sorted(int(p.stem) for p in root.glob("*.json") if p.stem.isdigit())
+
+
+class TenantNotLinked(Exception):
+    """У пользователя нет токена Google — сначала /link."""
+
+
+# ---------- пользователь ----------
+Job = Callable[["Tenant"], Awaitable[Any]]
+
+
+@dataclass(eq=False)
+class Tenant:
+    user_id: int
+    cal: CalendarClient
+    busy: FreeBusyIndex
+    digest: AgendaDigest
+    queue: asyncio.Queue
+    worker: Optional[asyncio.Task] = None
+    running: bool = False
+    pins: int = 0  # сколько submit() сейчас кладут задачу в очередь
+    closing: bool = False  # снят drop(): закроется, когда очередь опустеет
+
+    @property
+    def idle(self) -> bool:
+        return not self.running and not self.pins and self.queue.empty()
+
+    def close(self) -> None:
+        self.cal.close()
+
+
+class TenantPool:
+    """
+    LRU-кэш пользователей. build(user_id) строит Tenant (синхронно, в потоке —
+    разбор токена и discovery-документ); warm(tenant) — первичная загрузка
+    (индекс занятости и т.п.), уже в event loop.
+    """
+
+    def __init__(
+        self,
+        build: Callable[[int], Tenant],
+        warm: Callable[[Tenant], Awaitable[None]],
+        size: int = 64,
+        concurrency: int = 8,
+    ):
+        self._build = build
+        self._warm = warm
+        self.size = size
+        self._slots = asyncio.Semaphore(concurrency)
+        self._tenants: "OrderedDict[int, Tenant]" = OrderedDict()
+        self._building: Dict[int, asyncio.Future] = {}
+        # user_id → сколько submit() ещё ждут get(): тенанта, которого они вот-вот
+        # получат, вытеснять нельзя, хотя он пока простаивает
+        self._wanted: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._tenants)
+
+    def cached(self) -> List[Tenant]:
+        return list(self._tenants.values())
+
+    async def get(self, user_id: int) -> Tenant:
+        tenant = self._tenants.get(user_id)
+        if tenant is not None:
+            self._tenants.move_to_end(user_id)
+            return tenant
+        # один и тот же пользователь строится один раз, даже если запросы пришли разом
+        pending = self._building.get(user_id)
+        if pending is None:
+            pending = self._building[user_id] = asyncio.ensure_future(self._create(user_id))
+            pending.add_done_callback(lambda _f: self._building.pop(user_id, None))
+        return await asyncio.shield(pending)
+
+    async def _create(self, user_id: int) -> Tenant:
+        try:
+            tenant = await asyncio.to_thread(self._build, user_id)
+        except (FileNotFoundError, RuntimeError) as e:
+            raise TenantNotLinked(str(e)) from e
+        try:
+            await self._warm(tenant)
+        except Exception:
+            tenant.close()
+            raise
+        self._tenants[user_id] = tenant
+        self._evict()
+        logger.info("[TENANT] %s загружен (в кэше: %d)", user_id, len(self._tenants))
+        return tenant
+
+    def _evict(self) -> None:
+        # вытесняем самых давних из простаивающих; занятые подождут следующего раза,
+        # только что использованный (последний) не трогаем
+        for user_id in list(self._tenants)[:-1]:
+            if len(self._tenants) <= self.size:
+                return
+            tenant = self._tenants[user_id]
+            if tenant.idle and not self._wanted.get(user_id):
+                del self._tenants[user_id]
+                tenant.close()
+                logger.info("[TENANT] %s вытеснен из кэша", user_id)
+
+    def drop(self, user_id: int) -> None:
+        """
+        Забыть пользователя (например, токен отозван): следующий запрос перечитает файл.
+        Уже поставленные задачи доработают на старом клиенте — он закроется после них.
+        """
+        tenant = self._tenants.pop(user_id, None)
+        if tenant is not None:
+            tenant.closing = True
+            self._close_if_drained(tenant)
+
+    @staticmethod
+    def _close_if_drained(tenant: Tenant) -> None:
+        if tenant.closing and tenant.idle and (tenant.worker is None or tenant.worker.done()):
+            tenant.close()
+
+    async def submit(self, user_id: int, job: Job, wait: bool = False) -> asyncio.Future:
+        """
+        Поставить задачу в очередь пользователя. Возвращает future с результатом.
+        TenantNotLinked — токена нет; asyncio.QueueFull — очередь пользователя
+        переполнена (при wait=True вместо этого ждём места).
+        """
+        # держим пользователя до первого await: иначе _evict() из чужого _create()
+        # закроет тенанта между get() и постановкой в очередь
+        self._wanted[user_id] = self._wanted.get(user_id, 0) + 1
+        try:
+            tenant = await self.get(user_id)
+            while tenant.closing:  # снят drop(), пока мы ждали сборки
+                tenant = await self.get(user_id)
+        finally:
+            self._wanted[user_id] -= 1
+            if not self._wanted[user_id]:
+                del self._wanted[user_id]
+
+        tenant.pins += 1
+        try:
+            fut = asyncio.get_running_loop().create_future()
+            if wait:
+                # очередь не пуста — значит, воркер жив и место освободится
+                await tenant.queue.put((job, fut))
+            else:
+                tenant.queue.put_nowait((job, fut))
+            if tenant.worker is None or tenant.worker.done():
+                tenant.worker = asyncio.create_task(self._work(tenant))
+        finally:
+            tenant.pins -= 1
+            self._close_if_drained(tenant)
+        return fut
+
+    async def _work(self, tenant: Tenant) -> None:
+        while not tenant.queue.empty():
+            job, fut = tenant.queue.get_nowait()
+            tenant.running = True
+            try:
+                async with self._slots:
+                    result = await job(tenant)
+            except asyncio.CancelledError:
+                fut.cancel()
+                raise
+            except Exception as e:
+                if not fut.cancelled():
+                    fut.set_exception(e)
+            else:
+                if not fut.cancelled():
+                    fut.set_result(result)
+            finally:
+                tenant.running = False
+        if tenant.closing:
+            # снят drop(): очередь разобрана — клиент больше не нужен
+            # (если submit() ещё кладёт задачу, закроет следующий воркер)
+            if tenant.idle:
+                tenant.close()
+            return
+        # очередь опустела — можно вытеснять, если кэш переполнен
+        self._evict()
+
+    async def refresh_credentials(self, margin: timedelta) -> Tuple[int, int]:
+        """Фоновое обновление токенов закэшированных пользователей: (обновлено, сброшено)."""
+        refreshed = dropped = 0
+        for tenant in self.cached():
+            try:
+                if await asyncio.to_thread(tenant.cal.refresh_credentials, margin):
+                    refreshed += 1
+            except Exception as e:
+                # отозванный/испорченный токен — клиент больше не годится
+                logger.warning("[TENANT] %s: не удалось обновить токен: %s", tenant.user_id, e)
+                self.drop(tenant.user_id)
+                dropped += 1
+        return refreshed, dropped
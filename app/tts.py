@@ -4,20 +4,127 @@ from __future__ import annotations
 import os
 import asyncio
 import logging
+import math
+import sys
+import time
 from pathlib import Path
 import uuid
-from typing import Optional
+from typing import Awaitable, Callable, Dict, Optional
+
+from app.audio import encode_ogg_opus
+from app.tts_worker import REQUEST, RESPONSE
 
 logger = logging.getLogger(__name__)
 
 # Провайдеры и параметры по умолчанию
-TTS_PROVIDER = os.getenv("TTS_PROVIDER", "auto").lower()  # auto -> edge с fallback на gTTS
+TTS_PROVIDER = os.getenv("TTS_PROVIDER", "auto").lower()  # auto | edge | gtts | local
+# порядок провайдеров для auto: первые два хеджируются, остальные — запасные по очереди
+TTS_AUTO_CHAIN = [p.strip() for p in os.getenv("TTS_AUTO_CHAIN", "edge,gtts,local").lower().split(",") if p.strip()]
 TTS_VOICE = os.getenv("TTS_VOICE", "ru-RU-SvetlanaNeural")
 TTS_LANG = os.getenv("TTS_LANG", "ru")
 
 # Ограничения и дефолты
 MAX_TTS_CHARS = int(os.getenv("TTS_MAX_CHARS", "800"))  # чтобы не ломать TTS слишком длинным текстом
 TTS_TIMEOUT_SEC = int(os.getenv("TTS_TIMEOUT_SEC", "30"))  # таймаут одной попытки синтеза
+TTS_LOCAL_START_SEC = int(os.getenv("TTS_LOCAL_START_SEC", "30"))  # запуск и прогрев локального воркера
+
+# Хеджирование (только для auto): если первый провайдер цепочки не ответил за ~p95
+# своей задержки, параллельно запускаем второй; кто первый — того и ответ, второго отменяем
+TTS_HEDGE = os.getenv("TTS_HEDGE", "1") == "1"
+TTS_HEDGE_QUANTILE = float(os.getenv("TTS_HEDGE_QUANTILE", "0.95"))
+TTS_HEDGE_DELAY_SEC = float(os.getenv("TTS_HEDGE_DELAY_SEC", "3"))  # пока статистики мало
+TTS_HEDGE_MIN_SEC = float(os.getenv("TTS_HEDGE_MIN_SEC", "0.5"))
+
+
+class _LatencyHistogram:
+    """
+    Гистограмма задержек с экспоненциальными корзинами (≈ +25% на корзину,
+    от 50 мс до ~2 мин). Старые наблюдения постепенно «забываются»:
+    при переполнении все счётчики делятся пополам.
+
+    Отменённые и упавшие попытки — цензурированные наблюдения: известно лишь,
+    что ответ занял бы не меньше sec. Без них хвост (медленные запросы, которые
+    проиграли хедж) пропадал бы из статистики и p95 занижался бы.
+    """
+
+    BASE = 0.05
+    FACTOR = 1.25
+    BUCKETS = 36
+    MAX_TOTAL = 1000
+
+    def __init__(self):
+        self.counts = [0.0] * self.BUCKETS
+        self.total = 0.0
+
+    def _bucket(self, sec: float) -> int:
+        if sec <= self.BASE:
+            return 0
+        return min(int(math.log(sec / self.BASE, self.FACTOR)) + 1, self.BUCKETS - 1)
+
+    def observe(self, sec: float) -> None:
+        self._add({self._bucket(sec): 1.0})
+
+    def observe_censored(self, sec: float) -> None:
+        """
+        Наблюдение «не меньше sec»: единичный вес делим между корзинами от sec
+        и выше пропорционально уже накопленному (как в оценке Каплана — Майера);
+        если выше данных нет — кладём в корзину sec (оценка снизу).
+        """
+        b = self._bucket(sec)
+        above = sum(self.counts[b:])
+        if above <= 0:
+            self._add({b: 1.0})
+        else:
+            self._add({i: c / above for i, c in enumerate(self.counts[b:], start=b) if c})
+
+    def _add(self, weights: Dict[int, float]) -> None:
+        for i, w in weights.items():
+            self.counts[i] += w
+        self.total += 1
+        if self.total > self.MAX_TOTAL:
+            self.counts = [c / 2 for c in self.counts]
+            self.total /= 2
+
+    def quantile(self, q: float, min_samples: int = 20) -> Optional[float]:
+        """Верхняя граница корзины, в которую попадает квантиль q."""
+        if self.total < min_samples:
+            return None
+        need = q * self.total
+        acc = 0.0
+        for i, c in enumerate(self.counts):
+            acc += c
+            if acc >= need:
+                return self.BASE * self.FACTOR ** i
+        return self.BASE * self.FACTOR ** (self.BUCKETS - 1)
+
+
+_latency: Dict[str, _LatencyHistogram] = {
+    "edge": _LatencyHistogram(),
+    "gtts": _LatencyHistogram(),
+    "local": _LatencyHistogram(),
+}
+
+
+def _hedge_delay(name: Optional[str] = None) -> float:
+    name = name or (TTS_AUTO_CHAIN[0] if TTS_AUTO_CHAIN else "edge")
+    p = _latency[name].quantile(TTS_HEDGE_QUANTILE)
+    if p is None:
+        return TTS_HEDGE_DELAY_SEC
+    return min(max(p, TTS_HEDGE_MIN_SEC), TTS_TIMEOUT_SEC)
+
+
+def tts_latency_stats() -> Dict[str, Dict[str, Optional[float]]]:
+    """p50/p95 по провайдерам (сек) и текущая задержка хеджа."""
+    stats = {
+        name: {
+            "samples": h.total,
+            "p50": h.quantile(0.5, min_samples=1),
+            "p95": h.quantile(0.95, min_samples=1),
+        }
+        for name, h in _latency.items()
+    }
+    stats["hedge"] = {"delay": _hedge_delay()}
+    return stats
 
 
 def _truncate(text: str, max_len: int) -> str:
@@ -56,8 +163,105 @@ async def _gtts_synthesize(text: str, out_path_mp3: Path, lang: str):
     await asyncio.to_thread(_gtts_synthesize_sync, text, out_path_mp3, lang)
 
 
+# ---------- локальный синтез (espeak-ng в отдельном процессе) ----------
+class _LocalWorker:
+    """
+    Клиент app.tts_worker: процесс поднимается один раз и держит голос загруженным;
+    запросы идут по pipe строго по одному. Упал или завис — убиваем,
+    следующий запрос поднимет новый.
+    """
+
+    def __init__(self):
+        self._proc: Optional[asyncio.subprocess.Process] = None
+        self._lock = asyncio.Lock()
+        # движок не загрузился (нет библиотеки/голоса) — не перезапускаем на каждом запросе
+        self._broken: Optional[str] = None
+
+    async def start(self) -> None:
+        async with self._lock:
+            await self._ensure()
+
+    async def _ensure(self) -> None:
+        if self._proc is not None and self._proc.returncode is None:
+            return
+        if self._broken:
+            raise RuntimeError(self._broken)
+        self._proc = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "app.tts_worker",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            cwd=str(Path(__file__).resolve().parents[1]),
+        )
+        try:
+            ok, payload = await asyncio.wait_for(self._read(), TTS_LOCAL_START_SEC)
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+            self._kill()
+            raise RuntimeError(f"локальный TTS не запустился ({e!r})") from e
+        if not ok:
+            self._broken = f"локальный TTS недоступен: {payload.decode(errors='replace')}"
+            self._kill()
+            raise RuntimeError(self._broken)
+        logger.info("[TTS] локальный синтез готов (pid %s)", self._proc.pid)
+
+    async def synth(self, text: str) -> bytes:
+        # shield: отменённый запрос (проигравший хедж) всё равно дочитываем,
+        # иначе его ответ останется в pipe и достанется следующему
+        return await asyncio.shield(self._request(text))
+
+    async def _request(self, text: str) -> bytes:
+        async with self._lock:
+            await self._ensure()
+            data = text.encode("utf-8")
+            try:
+                self._proc.stdin.write(REQUEST.pack(len(data)) + data)
+                await self._proc.stdin.drain()
+                ok, payload = await asyncio.wait_for(self._read(), TTS_TIMEOUT_SEC)
+            except (asyncio.IncompleteReadError, ConnectionError, asyncio.TimeoutError) as e:
+                self._kill()
+                raise RuntimeError(f"локальный TTS: воркер не ответил ({e!r})") from e
+        if not ok:
+            raise RuntimeError(f"локальный TTS: {payload.decode(errors='replace')}")
+        return payload
+
+    async def _read(self):
+        status, n = RESPONSE.unpack(await self._proc.stdout.readexactly(RESPONSE.size))
+        return status == 0, await self._proc.stdout.readexactly(n)
+
+    def _kill(self) -> None:
+        proc, self._proc = self._proc, None
+        if proc is not None and proc.returncode is None:
+            proc.kill()
+            asyncio.ensure_future(proc.wait())  # забрать зомби
+
+
+_local = _LocalWorker()
+
+
+async def _local_synthesize(text: str, out_path_ogg: Path):
+    out_path_ogg.write_bytes(await _local.synth(_truncate(text, MAX_TTS_CHARS)))
+
+
+async def tts_warmup() -> None:
+    """Поднять локальный воркер заранее, если он участвует в синтезе."""
+    if TTS_PROVIDER == "local" or (TTS_PROVIDER == "auto" and "local" in TTS_AUTO_CHAIN):
+        try:
+            await _local.start()
+        except Exception as e:
+            logger.warning("[TTS] %s", e)
+
+
 # ---------- MP3 -> OGG (voice) ----------
 async def _mp3_to_ogg_voice(mp3_path: Path, ogg_path: Path):
+    # в процессе через PyAV; ffmpeg — только если PyAV не справился
+    try:
+        await asyncio.to_thread(encode_ogg_opus, mp3_path, ogg_path)
+        return
+    except Exception as e:
+        logger.warning("[TTS] PyAV не справился (%s) — использую ffmpeg", e)
+    await _mp3_to_ogg_voice_ffmpeg(mp3_path, ogg_path)
+
+
+async def _mp3_to_ogg_voice_ffmpeg(mp3_path: Path, ogg_path: Path):
     proc = await asyncio.create_subprocess_exec(
         "ffmpeg",
         "-y",
@@ -80,52 +284,116 @@ async def _mp3_to_ogg_voice(mp3_path: Path, ogg_path: Path):
         raise RuntimeError("ffmpeg: конвертация MP3 → OGG не удалась")
 
 
-async def synthesize_tts_async(text: str, out_dir: str = "./tmp_tts") -> Path:
+async def synthesize_tts_async(text: str, out_dir: str = "./tmp_tts", provider: Optional[str] = None) -> Path:
     """
     Асинхронно синтезирует речь:
-      - provider=edge → MP3 → OGG
-      - при ошибке edge и в режиме auto → fallback на gTTS
+      - provider=edge/gtts → MP3 → OGG; provider=local → сразу OGG из локального воркера
+      - auto → по цепочке TTS_AUTO_CHAIN (по умолчанию edge → gTTS → local)
+      - auto + TTS_HEDGE → первые два провайдера цепочки с хеджированием (см. _hedged)
+    provider — переопределить TTS_PROVIDER (например, для бенчмарка).
     Возвращает путь к OGG (для отправки как voice в Telegram).
     """
+    provider = (provider or TTS_PROVIDER).lower()
     out_dir_path = Path(out_dir)
     out_dir_path.mkdir(parents=True, exist_ok=True)
 
     base = uuid.uuid4().hex
-    mp3_path = out_dir_path / f"{base}.mp3"
-    ogg_path = out_dir_path / f"{base}.ogg"
 
     last_err: Optional[Exception] = None
 
-    async def _do_edge() -> Path:
-        logger.info("[TTS] edge-tts → MP3")
-        await _edge_tts_synthesize(text, mp3_path, TTS_VOICE)
-        logger.info("[TTS] ffmpeg: MP3 → OGG")
-        await _mp3_to_ogg_voice(mp3_path, ogg_path)
-        return ogg_path
-
-    async def _do_gtts() -> Path:
-        logger.info("[TTS] gTTS → MP3")
-        await _gtts_synthesize(text, mp3_path, TTS_LANG)
-        logger.info("[TTS] ffmpeg: MP3 → OGG")
-        await _mp3_to_ogg_voice(mp3_path, ogg_path)
-        return ogg_path
-
-    # Пытаемся через edge
-    if TTS_PROVIDER in ("edge", "auto"):
+    async def _timed(name: str, synth: Callable[[Path], Awaitable[None]]) -> Path:
+        # у каждого провайдера свои файлы — при хеджировании они работают параллельно
+        own_ogg = out_dir_path / f"{base}_{name}.ogg"
+        started = time.monotonic()
         try:
-            return await _do_edge()
+            await synth(own_ogg)
+        except BaseException:
+            # проиграл хедж (отменён) или упал: настоящая задержка — не меньше прошедшей
+            _latency[name].observe_censored(time.monotonic() - started)
+            raise
+        _latency[name].observe(time.monotonic() - started)
+        return own_ogg.replace(out_dir_path / f"{base}.ogg")
+
+    def _via_mp3(name: str, synth_mp3: Callable[[Path], Awaitable[None]]) -> Callable[[Path], Awaitable[None]]:
+        async def _run(ogg_path: Path) -> None:
+            mp3_path = ogg_path.with_suffix(".mp3")
+            logger.info("[TTS] %s → MP3", name)
+            await synth_mp3(mp3_path)
+            logger.info("[TTS] MP3 → OGG")
+            await _mp3_to_ogg_voice(mp3_path, ogg_path)
+        return _run
+
+    providers: Dict[str, Callable[[], Awaitable[Path]]] = {
+        "edge": lambda: _timed("edge", _via_mp3("edge", lambda p: _edge_tts_synthesize(text, p, TTS_VOICE))),
+        "gtts": lambda: _timed("gtts", _via_mp3("gtts", lambda p: _gtts_synthesize(text, p, TTS_LANG))),
+        "local": lambda: _timed("local", lambda p: _local_synthesize(text, p)),
+    }
+
+    # явный провайдер — без запасных
+    if provider != "auto":
+        if provider not in providers:
+            raise ValueError(f"Неизвестный TTS_PROVIDER: {provider}")
+        return await providers[provider]()
+
+    chain = [name for name in TTS_AUTO_CHAIN if name in providers]
+    rest = chain
+    if TTS_HEDGE and len(chain) >= 2:
+        try:
+            return await _hedged(chain[0], providers[chain[0]], chain[1], providers[chain[1]])
         except Exception as e:
             last_err = e
-            logger.error("[TTS] edge-tts ошибка: %s", e)
-            if TTS_PROVIDER == "edge":
-                raise
+        rest = chain[2:]
 
-    # Фоллбек на gTTS (в режиме auto) или явный gtts
-    if TTS_PROVIDER in ("gtts", "auto"):
+    # запасные — по очереди
+    for name in rest:
         try:
-            return await _do_gtts()
+            return await providers[name]()
         except Exception as e:
             last_err = e
-            logger.error("[TTS] gTTS ошибка: %s", e)
+            logger.error("[TTS] %s ошибка: %s", name, e)
+
+    raise RuntimeError(f"TTS synth failed. Last error: {last_err}")
+
+
+async def _hedged(
+    primary_name: str,
+    primary: Callable[[], Awaitable[Path]],
+    backup_name: str,
+    backup: Callable[[], Awaitable[Path]],
+) -> Path:
+    """
+    Запрос с хеджированием: primary стартует сразу, backup — если primary
+    не успел за _hedge_delay() или упал. Побеждает первый успешный, проигравший
+    отменяется (gTTS работает в потоке, local — в своём процессе: они доработают,
+    но результат выбросим).
+    """
+    delay = _hedge_delay(primary_name)
+    last_err: Optional[BaseException] = None
+    first = asyncio.create_task(primary())
+    pending = {first}
+    # отмена на любом await (в том числе во время ожидания delay) снимает
+    # все запущенные попытки — иначе primary осиротеет и доработает впустую
+    try:
+        done, _ = await asyncio.wait(pending, timeout=delay)
+        if first in done:
+            pending.discard(first)
+            if first.exception() is None:
+                return first.result()
+            last_err = first.exception()
+            logger.error("[TTS] %s ошибка: %s — переключаюсь на %s", primary_name, last_err, backup_name)
+        else:
+            logger.info("[TTS] %s медленнее %.1f с — параллельно запускаю %s", primary_name, delay, backup_name)
+        pending.add(asyncio.create_task(backup()))
+
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                last_err = task.exception()
+                logger.error("[TTS] ошибка провайдера: %s", last_err)
+    finally:
+        for task in pending:
+            task.cancel()
 
     raise RuntimeError(f"TTS synth failed. Last error: {last_err}")
@@ -0,0 +1,137 @@
+# app/tts_worker.py
+"""
+Процесс локального синтеза речи (espeak-ng через ctypes, без сети).
+Голос и словари загружаются один раз при старте; дальше текст приходит
+по stdin, готовый OGG/Opus уходит в stdout.
+
+    python -m app.tts_worker
+
+Протокол (числа — big-endian):
+  запрос: u32 длина + текст UTF-8
+  ответ:  u8 статус (0 — ок, 1 — ошибка) + u32 длина + OGG/Opus либо текст ошибки
+После прогрева воркер сам шлёт пустой ответ со статусом 0 — «готов».
+Закрытый stdin — сигнал завершиться.
+"""
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import io
+import logging
+import os
+import struct
+import sys
+from typing import BinaryIO, List
+
+from app.audio import encode_pcm_ogg_opus
+
+logger = logging.getLogger(__name__)
+
+REQUEST = struct.Struct(">I")
+RESPONSE = struct.Struct(">BI")
+
+# speak_lib.h
+_AUDIO_OUTPUT_SYNCHRONOUS = 2
+_INITIALIZE_DONT_EXIT = 0x8000
+_POS_CHARACTER = 1
+_CHARS_UTF8 = 1
+_PARAM_RATE = 1
+_EE_OK = 0
+
+_SYNTH_CALLBACK = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.POINTER(ctypes.c_short), ctypes.c_int, ctypes.c_void_p)
+
+
+class Espeak:
+    """libespeak-ng в синхронном режиме: synth() возвращает PCM s16le mono."""
+
+    def __init__(self, voice: str = "ru", rate: int = 175, lib: str | None = None):
+        name = lib or os.getenv("ESPEAK_LIB") or ctypes.util.find_library("espeak-ng")
+        if not name:
+            raise OSError("libespeak-ng не найдена (apt install espeak-ng)")
+        self._lib = ctypes.CDLL(name)
+        self._lib.espeak_Initialize.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_char_p, ctypes.c_int]
+        self._lib.espeak_SetVoiceByName.argtypes = [ctypes.c_char_p]
+        self._lib.espeak_SetParameter.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int]
+        self._lib.espeak_Synth.argtypes = [
+            ctypes.c_char_p, ctypes.c_size_t, ctypes.c_uint, ctypes.c_int,
+            ctypes.c_uint, ctypes.c_uint, ctypes.c_void_p, ctypes.c_void_p,
+        ]
+
+        self.sample_rate = self._lib.espeak_Initialize(_AUDIO_OUTPUT_SYNCHRONOUS, 0, None, _INITIALIZE_DONT_EXIT)
+        if self.sample_rate <= 0:
+            raise OSError("espeak_Initialize не удался")
+        self._chunks: List[bytes] = []
+        # ссылку на callback держим сами — иначе его соберёт GC, пока C его вызывает
+        self._callback = _SYNTH_CALLBACK(self._on_audio)
+        self._lib.espeak_SetSynthCallback(self._callback)
+        if self._lib.espeak_SetVoiceByName(voice.encode()) != _EE_OK:
+            raise OSError(f"голос espeak-ng {voice!r} не найден")
+        self._lib.espeak_SetParameter(_PARAM_RATE, rate, 0)
+
+    def _on_audio(self, wav, numsamples, _events) -> int:
+        if numsamples > 0 and wav:
+            self._chunks.append(ctypes.string_at(wav, numsamples * 2))
+        return 0  # 0 — продолжать синтез
+
+    def synth(self, text: str) -> bytes:
+        data = text.encode("utf-8") + b"\0"
+        self._chunks = []
+        err = self._lib.espeak_Synth(data, len(data), 0, _POS_CHARACTER, 0, _CHARS_UTF8, None, None)
+        if err != _EE_OK:
+            raise RuntimeError(f"espeak_Synth: код ошибки {err}")
+        self._lib.espeak_Synchronize()
+        pcm = b"".join(self._chunks)
+        if not pcm:
+            raise RuntimeError("espeak-ng не вернул звук")
+        return pcm
+
+
+def _reply(out: BinaryIO, status: int, payload: bytes) -> None:
+    out.write(RESPONSE.pack(status, len(payload)) + payload)
+    out.flush()
+
+
+def _read_exact(src: BinaryIO, n: int) -> bytes:
+    buf = b""
+    while len(buf) < n:
+        chunk = src.read(n - len(buf))
+        if not chunk:
+            raise EOFError
+        buf += chunk
+    return buf
+
+
+def _to_opus(engine: Espeak, text: str) -> bytes:
+    out = io.BytesIO()
+    encode_pcm_ogg_opus(engine.synth(text), engine.sample_rate, out)
+    return out.getvalue()
+
+
+def main() -> int:
+    # stdout — канал данных, логи только в stderr
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    stdin, stdout = sys.stdin.buffer, sys.stdout.buffer
+    try:
+        engine = Espeak(os.getenv("TTS_LOCAL_VOICE", "ru"), int(os.getenv("TTS_LOCAL_RATE", "175")))
+        # прогрев: голос, словари и кодек Opus — до первого настоящего запроса
+        _to_opus(engine, "Готово.")
+    except Exception as e:
+        _reply(stdout, 1, str(e).encode())
+        return 1
+    logger.info("[TTS-LOCAL] готов, %d Гц", engine.sample_rate)
+    _reply(stdout, 0, b"")
+
+    while True:
+        try:
+            (n,) = REQUEST.unpack(_read_exact(stdin, REQUEST.size))
+            text = _read_exact(stdin, n).decode("utf-8")
+        except EOFError:
+            return 0
+        try:
+            _reply(stdout, 0, _to_opus(engine, text))
+        except Exception as e:
+            _reply(stdout, 1, str(e).encode())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
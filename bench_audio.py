@@ -0,0 +1,91 @@
+"""
+Микро-бенчмарк: декодирование голосового (OGG/Opus → PCM 16 кГц) и кодирование
+ответа (MP3/PCM → OGG/Opus) — PyAV в процессе против запуска ffmpeg на каждое сообщение.
+
+    python bench_audio.py [voice.ogg] [-n 50]
+
+Без файла генерируется синтетическое голосовое на 3 секунды.
+Печатает среднюю задержку на сообщение и CPU (своего процесса + дочерних).
+"""
+import argparse
+import math
+import resource
+import shutil
+import struct
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+from app.audio import decode_to_pcm, encode_ogg_opus, encode_pcm_ogg_opus
+
+
+def _cpu() -> float:
+    me = resource.getrusage(resource.RUSAGE_SELF)
+    kids = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return me.ru_utime + me.ru_stime + kids.ru_utime + kids.ru_stime
+
+
+def _bench(name: str, fn, n: int) -> None:
+    fn()  # прогрев
+    cpu0, t0 = _cpu(), time.perf_counter()
+    for _ in range(n):
+        fn()
+    wall = (time.perf_counter() - t0) / n * 1000
+    cpu = (_cpu() - cpu0) / n * 1000
+    print(f"{name:<28} {wall:8.1f} мс/сообщ.  CPU {cpu:8.1f} мс/сообщ.")
+
+
+def _synthetic_voice(path: Path, seconds: float = 3.0) -> None:
+    rate = 16000
+    pcm = b"".join(
+        struct.pack("<h", int(6000 * math.sin(2 * math.pi * (200 + 40 * math.sin(i / 800)) * i / rate)))
+        for i in range(int(rate * seconds))
+    )
+    encode_pcm_ogg_opus(pcm, rate, path)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("ogg", nargs="?")
+    ap.add_argument("-n", type=int, default=50)
+    args = ap.parse_args()
+
+    tmp = Path(tempfile.mkdtemp())
+    src = Path(args.ogg) if args.ogg else tmp / "voice.ogg"
+    if not args.ogg:
+        _synthetic_voice(src)
+
+    dst = tmp / "out.ogg"
+    has_ffmpeg = shutil.which("ffmpeg") is not None
+
+    # те же команды, что в app/stt.py и app/tts.py
+    def _ffmpeg_decode():
+        subprocess.run(
+            ["ffmpeg", "-loglevel", "error", "-i", str(src), "-f", "s16le", "-ar", "16000", "-ac", "1", "-"],
+            check=True, stdout=subprocess.PIPE,
+        )
+
+    def _ffmpeg_encode():
+        subprocess.run(
+            ["ffmpeg", "-y", "-loglevel", "error", "-i", str(src), "-c:a", "libopus",
+             "-b:a", "64k", "-ar", "48000", "-ac", "1", str(dst)],
+            check=True,
+        )
+
+    print("STT: OGG/Opus → PCM 16 кГц mono")
+    _bench("PyAV (в процессе)", lambda: decode_to_pcm(src), args.n)
+    if has_ffmpeg:
+        _bench("ffmpeg (subprocess)", _ffmpeg_decode, args.n)
+
+    print("TTS: аудио → OGG/Opus 48 кГц")
+    _bench("PyAV (в процессе)", lambda: encode_ogg_opus(src, dst), args.n)
+    if has_ffmpeg:
+        _bench("ffmpeg (subprocess)", _ffmpeg_encode, args.n)
+
+    if not has_ffmpeg:
+        print("(ffmpeg не найден — сравнение с subprocess пропущено)")
+
+
+if __name__ == "__main__":
+    main()
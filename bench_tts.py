@@ -0,0 +1,60 @@
+"""
+Бенчмарк синтеза речи: локальный espeak-ng (предпрогретый воркер) против сетевых
+edge-tts и gTTS. Время — от текста до готового OGG/Opus для Telegram.
+
+    python bench_tts.py [-n 10] [-p local,edge,gtts]
+
+Для каждого провайдера печатает холодный старт (первый запрос) и p50/p95/среднее
+по остальным. Недоступный провайдер (нет сети, библиотеки) — строка с ошибкой.
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+
+from app.tts import synthesize_tts_async
+
+PHRASES = [
+    "Создала событие «планёрка» на 20.10.2026 09:00. Напомню за 15 мин.",
+    "Свободное окно: 21.10.2026 14:00–15:00",
+    "20.10.2026 10:00: встреча с клиентом\n20.10.2026 15:30: звонок директору",
+    "Перенёс «тренировка» на 22.10.2026 18:00",
+]
+
+
+def _pct(values, q):
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+async def _bench(provider: str, n: int, out_dir: str) -> None:
+    times = []
+    for i in range(n + 1):
+        started = time.perf_counter()
+        try:
+            await synthesize_tts_async(PHRASES[i % len(PHRASES)], out_dir=out_dir, provider=provider)
+        except Exception as e:
+            print(f"{provider:<6} недоступен: {e}")
+            return
+        times.append((time.perf_counter() - started) * 1000)
+    cold, warm = times[0], times[1:]
+    print(
+        f"{provider:<6} холодный {cold:8.0f} мс   p50 {_pct(warm, 0.5):7.0f} мс   "
+        f"p95 {_pct(warm, 0.95):7.0f} мс   среднее {statistics.mean(warm):7.0f} мс"
+    )
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", type=int, default=10)
+    ap.add_argument("-p", "--providers", default="local,edge,gtts")
+    args = ap.parse_args()
+
+    out_dir = tempfile.mkdtemp()
+    for provider in args.providers.split(","):
+        await _bench(provider.strip(), args.n, out_dir)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,43 @@
+# tests/test_commands.py
+from datetime import datetime
+
+import pytest
+
+from app import nlu
+from app.calendar_client import _matches
+
+NOW = datetime(2026, 10, 18, 10, 0)
+
+
+@pytest.mark.parametrize(
+    "text, selector, new_start",
+    [
+        ("перенеси планёрку на завтра в 10", "планёрку", datetime(2026, 10, 19, 10, 0)),
+        ("перенеси встречу с Иваном на пятницу в 15:00", "встречу с иваном", datetime(2026, 10, 23, 15, 0)),
+        ("перенеси отчёт на 25 декабря в 10:00", "отчёт", datetime(2026, 12, 25, 10, 0)),
+        ("перенеси планёрку", "планёрку", None),
+    ],
+)
+def test_move(text, selector, new_start):
+    intent = nlu.parse_intent(text, now=NOW, cache=False)
+    assert (intent.type, intent.selector, intent.new_start) == ("move", selector, new_start)
+
+
+@pytest.mark.parametrize(
+    "text, selector, series",
+    [
+        ("удали все планёрки", "планёрки", True),
+        ("удали серию тренировка", "тренировка", True),
+        ("отмени встречу с Иваном", "встречу с иваном", False),
+    ],
+)
+def test_delete(text, selector, series):
+    intent = nlu.parse_intent(text, now=NOW, cache=False)
+    assert (intent.type, intent.selector, intent.series) == ("delete", selector, series)
+
+
+def test_selector_matches_summary_in_any_form():
+    assert _matches("планёрки", "Планёрка")
+    assert _matches("встречу с иваном", "Встреча с Иваном Петровым")
+    assert not _matches("встречу с иваном", "Встреча с Олегом")
+    assert not _matches("", "Планёрка")
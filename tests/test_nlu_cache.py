@@ -0,0 +1,57 @@
+# tests/test_nlu_cache.py
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import nlu
+
+NOW = datetime(2026, 10, 18, 10, 0)
+# вечером «в 15:00» — уже завтра, а dateparser иногда теряет «завтра»
+EVENING = datetime(2026, 10, 18, 16, 0)
+
+# по фразе на каждый вид якоря (см. _create_anchor / _parse_uncached)
+PHRASES = [
+    "через 10 минут выключить чайник",      # now
+    "завтра в 10:00 оплатить хостинг",      # day
+    "в 15:00 позвонить маме",               # day (только часы)
+    "в пятницу в 14 часов встреча с Иваном", # weekday
+    "25 декабря в 20:00 поздравить",        # abs
+    "каждый понедельник в 9 планёрка",      # rrule
+    "2026-12-25 в 20:00 поздравить",        # дата цифрами — не кэшируется
+    "что у меня завтра",                    # list
+    "найди свободное окно завтра на час",   # free
+    "завтра в обед встреча с командой на 30 минут",  # «завтра» dateparser не видит
+    "перенеси планёрку на завтра в 10",     # move
+    "удали все планёрки",                   # delete
+]
+
+
+def _cold(text: str, now: datetime) -> nlu.Intent:
+    nlu._cache.clear()
+    return nlu.parse_intent(text, now=now)
+
+
+@pytest.mark.parametrize("text", PHRASES)
+@pytest.mark.parametrize("now", [NOW, EVENING])
+@pytest.mark.parametrize("shift", [timedelta(0), timedelta(hours=18), timedelta(days=1)])
+def test_cache_hit_matches_cold_parse(text, now, shift):
+    later = now + shift
+    expected = _cold(text, later)
+
+    nlu._cache.clear()
+    nlu.parse_intent(text, now=now)        # заполняет кэш
+    assert nlu.parse_intent(text, now=later) == expected
+
+
+def test_clock_only_phrase_is_next_occurrence():
+    nlu._cache.clear()
+    nlu.parse_intent("в 15:00 позвонить маме", now=EVENING)
+    hit = nlu.parse_intent("в 15:00 позвонить маме", now=EVENING + timedelta(hours=18))
+    assert hit.start == datetime(2026, 10, 19, 15, 0)
+
+
+def test_numeric_date_is_not_anchored_to_today():
+    nlu._cache.clear()
+    first = nlu.parse_intent("2026-12-25 в 20:00 поздравить", now=NOW)
+    second = nlu.parse_intent("2026-12-25 в 20:00 поздравить", now=NOW + timedelta(days=1))
+    assert first.start == second.start == datetime(2026, 12, 25, 20, 0)
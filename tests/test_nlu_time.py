@@ -0,0 +1,50 @@
+# tests/test_nlu_time.py
+from datetime import datetime
+
+import pytest
+
+from app import nlu
+
+NOW = datetime(2026, 10, 18, 10, 0)
+
+
+def _parse(text: str) -> nlu.Intent:
+    return nlu.parse_intent(text, now=NOW, cache=False)
+
+
+@pytest.mark.parametrize(
+    "text, start",
+    [
+        # число после «в» — не час: есть другое время или за ним не «утра/вечера/часов»
+        ("завтра совещание в 3 корпусе в 15:00", datetime(2026, 10, 18, 15, 0)),
+        ("завтра в 10:00 встреча в 5 кабинете", datetime(2026, 10, 19, 10, 0)),
+        # голый час
+        ("завтра встреча в 9", datetime(2026, 10, 19, 9, 0)),
+        ("завтра в 7 вечера ужин", datetime(2026, 10, 19, 19, 0)),
+        ("завтра в 9 утра зарядка", datetime(2026, 10, 19, 9, 0)),
+        ("в 3 часа забрать ребёнка", datetime(2026, 10, 19, 3, 0)),
+        ("каждый понедельник в 9 планёрка", datetime(2026, 10, 19, 9, 0)),
+    ],
+)
+def test_bare_hour(text, start):
+    intent = _parse(text)
+    assert intent.type == "create"
+    assert intent.start == start
+
+
+def test_number_is_not_an_hour():
+    assert _parse("купить в 2 магазинах хлеб").type == "unknown"
+    assert nlu._normalize_time_tokens("встреча в 5 кабинете") == "встреча в 5 кабинете"
+
+
+@pytest.mark.parametrize(
+    "text, title",
+    [
+        ("завтра в 10:00 встреча в 5 кабинете", "встреча 5 кабинете"),
+        ("завтра в 7 вечера ужин", "ужин"),
+        ("каждую среду в 18 тренировка", "тренировка"),
+    ],
+)
+def test_title_keeps_numbers_that_are_not_time(text, title):
+    assert _parse(text).title == title
+    assert nlu._clean_title("купить в 2 магазинах хлеб") == "купить 2 магазинах хлеб"
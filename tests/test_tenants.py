@@ -0,0 +1,52 @@
+# tests/test_tenants.py
+import asyncio
+
+from app.tenants import Tenant, TenantPool
+
+
+class FakeCal:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def _build(user_id):
+    return Tenant(user_id, FakeCal(), None, None, asyncio.Queue(maxsize=2))
+
+
+async def _warm(tenant):
+    # разное время прогрева — сборки завершаются вперемешку
+    await asyncio.sleep(0.01 * (tenant.user_id % 3))
+
+
+async def _job(tenant):
+    assert not tenant.cal.closed, f"задача {tenant.user_id} на закрытом клиенте"
+    await asyncio.sleep(0.01)
+    return tenant.user_id
+
+
+def test_submit_survives_eviction_by_concurrent_build():
+    async def main():
+        pool = TenantPool(_build, _warm, size=1, concurrency=2)
+        users = [1, 2, 3, 1, 2, 3, 4, 5]
+        futs = await asyncio.gather(*(pool.submit(u, _job, wait=True) for u in users))
+        assert await asyncio.gather(*futs) == users
+
+    asyncio.run(main())
+
+
+def test_drop_closes_only_after_queue_drained():
+    async def main():
+        pool = TenantPool(_build, _warm, size=4)
+        fut = await pool.submit(7, _job)
+        tenant = pool.cached()[0]
+        pool.drop(7)
+        assert not tenant.cal.closed
+        assert await fut == 7
+        await asyncio.sleep(0)
+        assert tenant.cal.closed
+        assert len(pool) == 0
+
+    asyncio.run(main())
@@ -0,0 +1,51 @@
+# tests/test_tts_hedge.py
+import asyncio
+
+from app import tts
+
+
+def test_censored_samples_raise_the_tail():
+    plain, censored = tts._LatencyHistogram(), tts._LatencyHistogram()
+    for h in (plain, censored):
+        for _ in range(95):
+            h.observe(0.5)
+        for _ in range(5):
+            h.observe(4.0)
+    # проигравшие хедж после 2 с: в plain их нет вовсе
+    for _ in range(20):
+        censored.observe_censored(2.0)
+    assert censored.total == 120
+    assert censored.quantile(0.9) > plain.quantile(0.9)
+    # без данных выше — оценка снизу, в корзину самого наблюдения
+    h = tts._LatencyHistogram()
+    h.observe_censored(1.0)
+    assert h.quantile(1.0, min_samples=1) >= 1.0
+
+
+def test_cancel_during_hedge_delay_cancels_primary():
+    started = asyncio.Event()
+    cancelled = []
+
+    async def slow():
+        started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def unused():
+        raise AssertionError("backup не должен стартовать")
+
+    async def main():
+        hedge = asyncio.create_task(tts._hedged("edge", slow, "gtts", unused))
+        await started.wait()
+        hedge.cancel()
+        try:
+            await hedge
+        except asyncio.CancelledError:
+            pass
+        await asyncio.sleep(0)
+        assert cancelled == [True]
+
+    asyncio.run(main())